@@ -0,0 +1,160 @@
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from npy_store import normalize_rows, top_k_rows
+
+IVF_FILE = "ivf.npz"
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """Nearest centroid (max cosine) of every row, in blocks to bound memory."""
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for s in range(0, vectors.shape[0], block):
+        chunk = np.asarray(vectors[s : s + block], dtype=np.float32)
+        out[s : s + block] = np.argmax(chunk @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    """Inverted-file ANN index in pure NumPy: spherical k-means centroids plus one row list per centroid.
+    A query scores the centroids, then only the rows of the `nprobe` closest lists (exact dot products).
+    Larger nprobe means higher recall and more latency; nprobe == nlist is exact search.
+    """
+
+    def __init__(self, centroids: np.ndarray, indptr: np.ndarray, rows: np.ndarray, nprobe: int = 8, fingerprint: str = ""):
+        self.centroids = centroids
+        self.indptr = indptr
+        self.rows = rows
+        self.nprobe = nprobe
+        self.fingerprint = fingerprint
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @staticmethod
+    def default_nlist(n: int) -> int:
+        return max(1, min(n, int(round(4 * math.sqrt(n)))))
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        nlist: Optional[int] = None,
+        iters: int = 20,
+        sample: int = 100_000,
+        seed: int = 0,
+        nprobe: int = 8,
+        fingerprint: str = "",
+    ) -> "IVFIndex":
+        n = vectors.shape[0]
+        nlist = min(nlist or cls.default_nlist(n), n)
+        rng = np.random.default_rng(seed)
+        # k-means on a sample, then assign every row
+        train_idx = np.sort(rng.choice(n, size=min(n, max(sample, nlist)), replace=False))
+        train = normalize_rows(vectors[train_idx])
+        centroids = train[rng.choice(train.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = _assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, train)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty lists with random training rows
+                sums[empty] = train[rng.choice(train.shape[0], size=int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        counts = np.bincount(labels, minlength=nlist)
+        indptr = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(centroids.astype(np.float32), indptr, order, nprobe=min(nprobe, nlist), fingerprint=fingerprint)
+
+    def save(self, persist_dir: Path) -> Path:
+        path = Path(persist_dir) / IVF_FILE
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            centroids=self.centroids,
+            indptr=self.indptr,
+            rows=self.rows,
+            nprobe=np.asarray([self.nprobe], dtype=np.int64),
+            fingerprint=np.frombuffer(self.fingerprint.encode("ascii"), dtype=np.uint8),
+        )
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "IVFIndex":
+        with np.load(Path(persist_dir) / IVF_FILE) as data:
+            return cls(
+                data["centroids"],
+                data["indptr"],
+                data["rows"],
+                nprobe=int(data["nprobe"][0]),
+                fingerprint=data["fingerprint"].tobytes().decode("ascii"),
+            )
+
+    @staticmethod
+    def exists(persist_dir: Path) -> bool:
+        return (Path(persist_dir) / IVF_FILE).exists()
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        probes = min(nprobe or self.nprobe, self.nlist)
+        lists, _ = top_k_rows(self.centroids @ query, probes)
+        return np.concatenate([self.rows[self.indptr[c] : self.indptr[c + 1]] for c in lists])
+
+    def search(self, store, query: np.ndarray, top_k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) best first over an NpyVectorStore; `query` comes from store.prepare_query."""
+        cand = np.sort(self.candidates(query, nprobe))  # sorted rows keep mmap reads sequential
+        if cand.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = store.score_rows(cand, query)
+        idx, top = top_k_rows(scores, top_k)
+        return cand[idx], top
+
+
+def sample_queries(vectors: np.ndarray, n: int = 200, noise: float = 0.5, seed: int = 1) -> np.ndarray:
+    """Self-check queries: stored vectors plus Gaussian noise of norm ~`noise` (stand-ins for paraphrases)."""
+    rng = np.random.default_rng(seed)
+    idx = np.sort(rng.choice(vectors.shape[0], size=min(n, vectors.shape[0]), replace=False))
+    q = np.asarray(vectors[idx], dtype=np.float32)
+    q = q + rng.normal(scale=noise / math.sqrt(q.shape[1]), size=q.shape).astype(np.float32)
+    return normalize_rows(q)
+
+
+def recall_at_k(
+    store, ivf: IVFIndex, queries: np.ndarray, k: int = 8, nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32)
+) -> List[Dict[str, float]]:
+    """Recall@k of the IVF search against exact search over the same NpyVectorStore, per nprobe.
+    `queries` are already in the stored space (see sample_queries)."""
+    mat = store.decode()
+    exact = [set(top_k_rows(mat @ q, k)[0].tolist()) for q in queries]
+    report = []
+    for nprobe in sorted({min(p, ivf.nlist) for p in nprobes}):
+        hits = 0
+        t0 = time.perf_counter()
+        found = [ivf.search(store, q, k, nprobe=nprobe)[0] for q in queries]
+        ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(queries))
+        for truth, rows in zip(exact, found):
+            hits += len(truth & set(rows.tolist()))
+        report.append({
+            "nprobe": nprobe,
+            "recall": hits / max(1, sum(len(t) for t in exact)),
+            "ms_per_query": ms,
+            "scanned": float(np.mean([ivf.candidates(q, nprobe).size for q in queries])) if len(queries) else 0.0,
+        })
+    return report
+
+
+def pick_nprobe(report: Sequence[Dict[str, float]], target_recall: float) -> int:
+    """Smallest nprobe reaching the target recall (the largest measured one otherwise)."""
+    for row in report:
+        if row["recall"] >= target_recall:
+            return int(row["nprobe"])
+    return int(report[-1]["nprobe"]) if report else 1
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+from query_cache import normalize_query
+
+# Generation params that change the answer (eos/pad ids follow from the model id)
+KEY_PARAMS = ("max_new_tokens", "do_sample", "temperature", "top_p", "top_k", "repetition_penalty", "no_repeat_ngram_size")
+
+
+class AnswerCache:
+    """Final answers of (near-)deterministic requests in a SQLite file, shared across restarts and processes.
+    Keys cover model id, normalized question, prompt tokens, retrieved node ids and generation params.
+    Only greedy requests are cached by default; `max_temperature` > 0 also admits cold sampling. Least recently used answers are evicted
+    past `max_mb` (budget shared by the whole file). Each `namespace` (e.g. model + index directory)
+    records its own index fingerprint; a rebuild only drops that namespace's answers, so tools and
+    indexes sharing the file do not wipe each other.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        model_id: str,
+        fingerprint: str = "",
+        max_mb: float = 64.0,
+        max_temperature: float = 0.0,
+        namespace: Optional[str] = None,
+    ):
+        self.path = Path(path)
+        self.model_id = model_id
+        self.namespace = namespace if namespace is not None else model_id
+        self.fingerprint = fingerprint
+        self.max_bytes = int(max_mb * 2**20)
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5.0)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            columns = [r[1] for r in self._db.execute("PRAGMA table_info(answers)")]
+            if columns and "namespace" not in columns:
+                # Files from before namespaces had one global fingerprint; it is only a cache
+                self._db.execute("DROP TABLE answers")
+                self._db.execute("DROP TABLE IF EXISTS meta")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, answer TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_namespace ON answers(namespace)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS namespaces (name TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)")
+        self.bind(fingerprint)
+
+    def bind(self, fingerprint: str) -> None:
+        """Invalidate this namespace's answers if its index changed since they were stored."""
+        with self._lock, self._db:
+            self.fingerprint = fingerprint
+            row = self._db.execute("SELECT fingerprint FROM namespaces WHERE name = ?", (self.namespace,)).fetchone()
+            if row is not None and row[0] == fingerprint:
+                return
+            if row is not None:
+                n = self._db.execute("SELECT COUNT(*) FROM answers WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+                print(f"[answer_cache] Indice cambiado: {n} respuestas invalidadas ({self.namespace})")
+            self._db.execute("DELETE FROM answers WHERE namespace = ?", (self.namespace,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO namespaces (name, fingerprint) VALUES (?, ?)", (self.namespace, fingerprint)
+            )
+
+    def cacheable(self, gen_kwargs: dict) -> bool:
+        """Greedy decoding, or (opt-in via max_temperature) sampling cold enough to be nearly deterministic."""
+        if not gen_kwargs.get("do_sample"):
+            return True
+        return self.max_temperature > 0 and float(gen_kwargs.get("temperature", 1.0)) <= self.max_temperature
+
+    def make_key(
+        self,
+        question: str,
+        prompt_ids: Optional[Sequence[int]],
+        node_ids: Iterable[str],
+        gen_kwargs: dict,
+    ) -> str:
+        payload = {
+            "model": self.model_id,
+            "namespace": self.namespace,
+            "index": self.fingerprint,
+            "question": normalize_query(question),
+            # The prompt tokens already cover history, system prompt and retrieved text
+            "prompt": hashlib.sha256(json.dumps(list(prompt_ids)).encode("ascii")).hexdigest() if prompt_ids is not None else None,
+            "nodes": list(node_ids),
+            "params": {k: gen_kwargs.get(k) for k in KEY_PARAMS if k in gen_kwargs},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock, self._db:
+            row = self._db.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, answer: str) -> None:
+        now = time.time()
+        size = len(answer.encode("utf-8")) + len(key)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, namespace, answer, size, created, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, self.namespace, answer, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used answers down to 90% of the budget
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM answers ORDER BY last_used"):
+            stale.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._db.executemany("DELETE FROM answers WHERE key = ?", stale)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_mb": round(size / 2**20, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
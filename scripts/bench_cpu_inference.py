@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_PROMPTS = [
+    "¿Qué es DLPNO-CCSD(T) en ORCA?",
+    "Dame un input mínimo de ORCA para una optimización B3LYP/def2-SVP del agua.",
+    "Diferencias entre RIJCOSX y RIJK en ORCA.",
+]
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size in MB (psutil if installed, /proc on Linux)."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB en Linux
+    except ImportError:
+        return None
+
+
+def run_mode(
+    model_id: str, mode: str, threads: Optional[int], max_new_tokens: int, prompts,
+    draft_model_id: Optional[str] = None, draft_tokens: int = 0,
+) -> dict:
+    """Load the model in one CPU mode and time greedy generation (runs inside a child process).
+    With a draft model the same prompts are also run with assisted generation and compared token by token."""
+    import torch
+
+    os.environ["FORCE_CPU"] = "1"
+    from chat_app import format_prompt, load_qwen
+
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    tokenizer, model = load_qwen(model_id, cpu_quant=mode, threads=threads)
+    load_s = time.perf_counter() - t0
+    rss_loaded = rss_mb()
+
+    def _gen(msg: str, n: int, extra: Optional[dict] = None):
+        prompt = format_prompt("Eres un asistente técnico.", [], msg, tokenizer)
+        inputs = tokenizer(prompt, return_tensors="pt")
+        with torch.inference_mode():
+            out = model.generate(
+                **inputs,
+                max_new_tokens=n,
+                min_new_tokens=n,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+                **(extra or {}),
+            )
+        return out[0, inputs["input_ids"].shape[1]:].tolist()
+
+    _gen(prompts[0], 4)  # warm-up
+    new_tokens = 0
+    outputs = []
+    t0 = time.perf_counter()
+    for msg in prompts:
+        outputs.append(_gen(msg, max_new_tokens))
+        new_tokens += len(outputs[-1])
+    gen_s = time.perf_counter() - t0
+
+    draft_res = {}
+    if draft_model_id:
+        from speculative import DraftModel, StepCounter
+
+        draft_tokenizer, draft_model = load_qwen(draft_model_id, cpu_quant=mode, threads=threads)
+        draft = DraftModel(draft_model, draft_tokenizer, tokenizer, num_tokens=draft_tokens)
+        greedy = {"do_sample": False}
+        _gen(prompts[0], 4, draft.gen_kwargs(greedy))  # warm-up
+        counter = StepCounter()
+        identical = 0
+        t0 = time.perf_counter()
+        for msg, ref in zip(prompts, outputs):
+            out = _gen(msg, max_new_tokens, {**draft.gen_kwargs(greedy), "streamer": counter})
+            identical += int(out == ref)
+        draft_s = time.perf_counter() - t0
+        draft.record(counter)
+        draft_res = {
+            "draft_model": draft_model_id,
+            "draft_tokens_per_s": round(new_tokens / draft_s, 2) if draft_s > 0 else None,
+            "speedup": round(gen_s / draft_s, 2) if draft_s > 0 else None,
+            "identical": f"{identical}/{len(prompts)}",
+            **{k: v for k, v in draft.stats().items() if k in ("tokens_per_step", "acceptance", "same_vocab")},
+        }
+    return {
+        "mode": mode,
+        "threads": torch.get_num_threads(),
+        "load_s": round(load_s, 2),
+        "tokens": new_tokens,
+        "tokens_per_s": round(new_tokens / gen_s, 2) if gen_s > 0 else None,
+        "rss_model_mb": round(rss_loaded - rss_before, 1) if rss_loaded and rss_before else None,
+        "rss_mb": round(rss_mb() or 0, 1),
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1),
+        **draft_res,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia en CPU: tokens/s y RSS por modo")
+    parser.add_argument("--model-id", default="Qwen/Qwen2.5-0.5B-Instruct", help="HF model id o ruta local")
+    parser.add_argument("--modes", nargs="*", default=["none", "int8", "bf16"], help="Modos CPU a medir")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de torch (por defecto todos)")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Tokens generados por prompt")
+    parser.add_argument("--draft-model", default=None, help="Medir también la generación asistida con este modelo borrador")
+    parser.add_argument("--draft-tokens", type=int, default=0, help="Tokens propuestos por paso (0 = automático)")
+    parser.add_argument("--out", default=None, help="Guardar los resultados en JSON")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Proceso hijo: un modo por proceso para que el RSS no se mezcle entre modos
+        res = run_mode(
+            args.model_id, args.child, args.threads, args.max_new_tokens, DEFAULT_PROMPTS,
+            draft_model_id=args.draft_model, draft_tokens=args.draft_tokens,
+        )
+        print("BENCH_RESULT " + json.dumps(res))
+        return
+
+    results = []
+    for mode in args.modes:
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--child", mode,
+               "--model-id", args.model_id, "--max-new-tokens", str(args.max_new_tokens)]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        if args.draft_model:
+            cmd += ["--draft-model", args.draft_model, "--draft-tokens", str(args.draft_tokens)]
+        print(f"== Modo {mode} ==")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("BENCH_RESULT ")), None)
+        if proc.returncode != 0 or line is None:
+            print(f"[bench] Modo {mode} fallido:\n{proc.stderr[-2000:]}")
+            results.append({"mode": mode, "error": proc.stderr.strip().splitlines()[-1:] or ["?"]})
+            continue
+        results.append(json.loads(line[len("BENCH_RESULT "):]))
+
+    print(f"\n{'modo':<6} {'hilos':>5} {'carga s':>8} {'tok/s':>8} {'RSS modelo MB':>14} {'RSS pico MB':>12}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<6} ERROR {r['error'][0]}")
+            continue
+        print(f"{r['mode']:<6} {r['threads']:>5} {r['load_s']:>8} {r['tokens_per_s']:>8} "
+              f"{r['rss_model_mb']!s:>14} {r['peak_rss_mb']:>12}")
+        if "speedup" in r:
+            print(f"{'':<6} borrador {r['draft_model']}: {r['draft_tokens_per_s']} tok/s, x{r['speedup']}, "
+                  f"{r['tokens_per_step']} tokens/paso, aceptación {r.get('acceptance', '-')}, idénticas {r['identical']}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Resultados en: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
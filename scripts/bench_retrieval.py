@@ -0,0 +1,217 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from npy_store import FULL_VECTORS_FILE, is_npy_store, read_manifest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_PERSIST = PROJECT_ROOT / "data" / "llamaindex" / "storage"
+MODES = ("dense", "hybrid", "ann", "ann+hybrid")
+
+
+def load_qa(path: Path) -> List[dict]:
+    """QA pairs: {"question": ..., "source_path": ..., "section_path": [...] or "A / B"} per line."""
+    items = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            sec = rec.get("section_path")
+            if isinstance(sec, str):
+                sec = [s.strip() for s in sec.split("/") if s.strip()]
+            items.append({"question": rec["question"], "source_path": rec.get("source_path"), "section_path": sec or None})
+    return items
+
+
+def _norm_path(p: str) -> str:
+    return p.replace("\\", "/").strip().lower()
+
+
+def is_relevant(meta: dict, expected: dict) -> bool:
+    """A retrieved chunk matches if its source path ends with the expected one and/or its
+    section path starts with the expected headings (case-insensitive)."""
+    if expected.get("source_path"):
+        src = _norm_path(str(meta.get("source_path") or meta.get("doc") or ""))
+        want = _norm_path(expected["source_path"])
+        if not src or not (src.endswith(want) or want.endswith(src)):
+            return False
+    if expected.get("section_path"):
+        got = [s.strip().lower() for s in (meta.get("section_path") or [])]
+        want = [s.strip().lower() for s in expected["section_path"]]
+        if got[: len(want)] != want:
+            return False
+    return bool(expected.get("source_path") or expected.get("section_path"))
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def index_size_mb(persist_dir: Path) -> Dict[str, float]:
+    """On-disk size; 'served' excludes the full-precision copy only used by incremental builds."""
+    total = served = 0
+    for p in persist_dir.iterdir():
+        if p.is_file():
+            total += p.stat().st_size
+            if p.name != FULL_VECTORS_FILE:
+                served += p.stat().st_size
+    return {"total_mb": total / 2**20, "served_mb": served / 2**20}
+
+
+def evaluate(retriever, qa: List[dict], query_vectors: List[List[float]], ks: Sequence[int]) -> dict:
+    """recall@k (hit rate), MRR@max(k) and retrieval latency, reusing precomputed query embeddings."""
+    from llama_index.core.schema import QueryBundle
+
+    max_k = max(ks)
+    first_hit: List[Optional[int]] = []
+    latencies = []
+    for item, vec in zip(qa, query_vectors):
+        t0 = time.perf_counter()
+        nodes = retriever.retrieve(QueryBundle(query_str=item["question"], embedding=list(vec)))
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        rank = next((i for i, n in enumerate(nodes[:max_k], 1) if is_relevant(n.node.metadata or {}, item)), None)
+        first_hit.append(rank)
+    n = max(1, len(qa))
+    return {
+        "recall": {k: sum(1 for r in first_hit if r is not None and r <= k) / n for k in ks},
+        "mrr": sum(1.0 / r for r in first_hit if r is not None) / n,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def served_mode(retriever) -> str:
+    """Mode the loaded retriever actually serves: load_retriever falls back to exact/dense search
+    when ivf.npz or bm25.npz is missing or stale."""
+    from retrievers import HybridRetriever
+
+    store = getattr(retriever, "_store", None)
+    ann = store is not None and store.ann is not None
+    hybrid = isinstance(retriever, HybridRetriever)
+    return {(False, False): "dense", (False, True): "hybrid", (True, False): "ann", (True, True): "ann+hybrid"}[(ann, hybrid)]
+
+
+def time_answers(llm, retriever, qa: List[dict], max_new_tokens: int, context_budget=None) -> dict:
+    """End-to-end latency (retrieval + prompt + greedy generation) through the chat_app path,
+    with the same context budget the app packs the prompt with."""
+    from chat_app import postprocess_output, prepare_generation, safe_generate
+
+    tokenizer, model = llm
+    latencies = []
+    for item in qa:
+        t0 = time.perf_counter()
+        inputs, gen_kwargs = prepare_generation(
+            item["question"], [], tokenizer, model, max_new_tokens, 0.0, 1.0, 50, 1.1, True, retriever, False, context_budget
+        )
+        output = safe_generate(model, inputs, gen_kwargs)
+        postprocess_output(item["question"], tokenizer.decode(output[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True))
+        latencies.append(time.perf_counter() - t0)
+    return {"answer_p50_s": percentile(latencies, 50), "answer_p95_s": percentile(latencies, 95)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval benchmark: recall@k, MRR, latency, build time and size per setting")
+    parser.add_argument("--qa", required=True, help="JSONL with question -> expected source_path/section_path")
+    parser.add_argument("--persist", nargs="+", default=[str(DEFAULT_PERSIST)], help="Index dirs to compare (e.g. built with different chunking)")
+    parser.add_argument("--embed-model", default=None, help="Embedding model (defaults to the one in each manifest)")
+    parser.add_argument("--top-k", nargs="+", type=int, default=[1, 3, 5, 8], help="k values for recall@k")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["dense"], help="Retrieval modes to compare")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed in ann modes (default: value stored at build time)")
+    parser.add_argument("--llm-model", default=None, help="Also time end-to-end answers with this chat model (see --fast)")
+    parser.add_argument("--max-new-tokens", type=int, default=128, help="Answer length for the LLM stage")
+    parser.add_argument("--context-tokens", type=int, default=3072, help="Prompt token budget for the LLM stage, as chat_app (0 = legacy 600-char cut)")
+    parser.add_argument("--passage-tokens", type=int, default=1536, help="Passage tokens within --context-tokens, as chat_app")
+    parser.add_argument("--history-tokens", type=int, default=768, help="History tokens within --context-tokens, as chat_app")
+    parser.add_argument("--fast", action="store_true", help="Retrieval only: skip the LLM stage even if --llm-model is set")
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    from retrievers import load_retriever
+
+    qa = load_qa(Path(args.qa).expanduser().resolve())
+    if not qa:
+        raise SystemExit("No QA pairs found")
+    ks = sorted(set(args.top_k))
+    print(f"{len(qa)} questions, k={ks}, modes={args.modes}")
+
+    embedders: Dict[str, object] = {}
+    query_vectors: Dict[str, List[List[float]]] = {}
+    results = []
+    llm = None
+    for persist in args.persist:
+        persist_dir = Path(persist).expanduser().resolve()
+        manifest = read_manifest(persist_dir) if is_npy_store(persist_dir) else {}
+        model_id = args.embed_model or manifest.get("embed_model") or "BAAI/bge-m3"
+        if model_id not in embedders:
+            embedders[model_id] = HuggingFaceEmbedding(model_name=model_id, cache_folder=str(PROJECT_ROOT / ".cache"))
+            # Query embeddings are shared by every setting using this model, so latency below is search only
+            t0 = time.perf_counter()
+            query_vectors[model_id] = [embedders[model_id].get_query_embedding(item["question"]) for item in qa]
+            ms = (time.perf_counter() - t0) * 1000.0 / len(qa)
+            print(f"[{model_id}] query embedding: {ms:.1f} ms/query")
+        build = manifest.get("build") or {}
+        size = index_size_mb(persist_dir)
+        for mode in args.modes:
+            retriever = load_retriever(
+                persist_dir,
+                embedders[model_id],
+                similarity_top_k=max(ks),
+                hybrid="hybrid" in mode,
+                ann=mode.startswith("ann"),
+                nprobe=args.nprobe,
+            )
+            served = served_mode(retriever)
+            if served != mode:
+                # Would duplicate the `served` row under the wrong label
+                print(f"[{persist_dir.name}] {mode}: not available, would be served as {served} (missing or stale index file); row skipped")
+                continue
+            row = {
+                "index": persist_dir.name,
+                "mode": mode,
+                "embed_model": model_id,
+                "n_chunks": manifest.get("count"),
+                "avg_chars": build.get("avg_chars"),
+                "build_s": build.get("seconds"),
+                **size,
+                **evaluate(retriever, qa, query_vectors[model_id], ks),
+            }
+            if args.llm_model and not args.fast:
+                if llm is None:
+                    from chat_app import load_qwen
+
+                    llm = load_qwen(args.llm_model)
+                budget = None
+                if args.context_tokens > 0:
+                    from context_packer import ContextBudget
+
+                    budget = ContextBudget(total=args.context_tokens, passages=args.passage_tokens, history=args.history_tokens)
+                row.update(time_answers(llm, retriever, qa, args.max_new_tokens, budget))
+            results.append(row)
+
+    header = f"{'index':<18} {'mode':<10} {'chunks':>7} " + " ".join(f"{'R@' + str(k):>6}" for k in ks)
+    header += f" {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7} {'build s':>8} {'MB':>8}"
+    if any("answer_p50_s" in r for r in results):
+        header += f" {'ans p50 s':>9} {'ans p95 s':>9}"
+    print("\n" + header)
+    for r in results:
+        line = f"{r['index'][:18]:<18} {r['mode']:<10} {r['n_chunks'] or '-':>7} "
+        line += " ".join(f"{r['recall'][k]:>6.3f}" for k in ks)
+        line += f" {r['mrr']:>6.3f} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} {r['build_s'] or '-':>8} {r['served_mb']:>8.1f}"
+        if "answer_p50_s" in r:
+            line += f" {r['answer_p50_s']:>9.2f} {r['answer_p95_s']:>9.2f}"
+        print(line)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Results written to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
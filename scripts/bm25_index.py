@@ -0,0 +1,150 @@
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from npy_store import top_k_rows
+
+BM25_FILE = "bm25.npz"
+
+# Keeps ORCA keywords intact: DLPNO-CCSD(T), RIJCOSX, def2-TZVP, def2/J, %mdci, PAL8, 6-31G*...
+TOKEN_RE = re.compile(r"%?\w+(?:[-/+.()*']\w*)*\)?", re.UNICODE)
+_SUBTOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by for from has have in is it its of on or that the this to was were which with
+    al como con de del el en es la las lo los para por que se su sus un una y o qué cómo cuál cuáles entre
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound tokens are kept whole and also split into their parts."""
+    out: List[str] = []
+    for m in TOKEN_RE.finditer(text):
+        tok = m.group(0).rstrip(".,;:'")
+        # Drop unmatched closing parens one at a time: "(DLPNO-CCSD(T))" -> "dlpno-ccsd(t)"
+        extra = tok.count(")") - tok.count("(")
+        while extra > 0 and tok.endswith(")"):
+            tok = tok[:-1]
+            extra -= 1
+        tok = tok.lower()
+        if not tok or tok in STOPWORDS:
+            continue
+        out.append(tok)
+        if not tok.isalnum():
+            for part in _SUBTOKEN_RE.findall(tok):
+                if len(part) > 1 and part != tok and part not in STOPWORDS:
+                    out.append(part)
+    return out
+
+
+class BM25Index:
+    """Okapi BM25 over CSR postings. Impacts (idf x saturated tf) are precomputed at build time,
+    so a query is one gather-and-add per query term.
+    """
+
+    def __init__(
+        self, terms: List[str], indptr: np.ndarray, doc_ids: np.ndarray, impacts: np.ndarray, n_docs: int, fingerprint: str = ""
+    ):
+        self.terms = terms
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.n_docs = n_docs
+        # Vector store fingerprint the rows belong to (a stale bm25.npz must not be fused)
+        self.fingerprint = fingerprint
+        self._term_index: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75, fingerprint: str = "") -> "BM25Index":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_len: List[int] = []
+        for doc_id, text in enumerate(texts):
+            toks = tokenize(text)
+            doc_len.append(len(toks))
+            for tok in toks:
+                d = postings.setdefault(tok, {})
+                d[doc_id] = d.get(doc_id, 0) + 1
+        n_docs = len(doc_len)
+        lens = np.asarray(doc_len, dtype=np.float32)
+        avgdl = float(lens.mean()) if n_docs else 0.0
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        ids_parts: List[np.ndarray] = []
+        imp_parts: List[np.ndarray] = []
+        for i, term in enumerate(terms):
+            plist = postings[term]
+            ids = np.fromiter(plist.keys(), dtype=np.int32, count=len(plist))
+            tf = np.fromiter(plist.values(), dtype=np.float32, count=len(plist))
+            order = np.argsort(ids)
+            ids, tf = ids[order], tf[order]
+            idf = math.log(1.0 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = k1 * (1.0 - b + b * lens[ids] / max(avgdl, 1e-9))
+            ids_parts.append(ids)
+            imp_parts.append((idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+            indptr[i + 1] = indptr[i] + len(ids)
+        doc_ids = np.concatenate(ids_parts) if ids_parts else np.zeros(0, dtype=np.int32)
+        impacts = np.concatenate(imp_parts) if imp_parts else np.zeros(0, dtype=np.float32)
+        return cls(terms, indptr, doc_ids, impacts, n_docs, fingerprint=fingerprint)
+
+    def save(self, persist_dir: Path) -> Path:
+        path = Path(persist_dir) / BM25_FILE
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            terms=np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8),
+            indptr=self.indptr,
+            doc_ids=self.doc_ids,
+            impacts=self.impacts,
+            n_docs=np.asarray([self.n_docs], dtype=np.int64),
+            fingerprint=np.frombuffer(self.fingerprint.encode("ascii"), dtype=np.uint8),
+        )
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "BM25Index":
+        with np.load(Path(persist_dir) / BM25_FILE) as data:
+            raw = data["terms"].tobytes().decode("utf-8")
+            terms = raw.split("\n") if raw else []
+            # Files written before the fingerprint existed never match the store
+            fingerprint = data["fingerprint"].tobytes().decode("ascii") if "fingerprint" in data.files else ""
+            return cls(terms, data["indptr"], data["doc_ids"], data["impacts"], int(data["n_docs"][0]), fingerprint=fingerprint)
+
+    @staticmethod
+    def exists(persist_dir: Path) -> bool:
+        return (Path(persist_dir) / BM25_FILE).exists()
+
+    @staticmethod
+    def remove(persist_dir: Path) -> None:
+        (Path(persist_dir) / BM25_FILE).unlink(missing_ok=True)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for tok in set(tokenize(query)):
+            ti = self._term_index.get(tok)
+            if ti is None:
+                continue
+            s, e = self.indptr[ti], self.indptr[ti + 1]
+            # doc ids are unique within a postings list, so fancy-index += is safe
+            scores[self.doc_ids[s:e]] += self.impacts[s:e]
+        return scores
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.scores(query)
+        rows, top = top_k_rows(scores, top_k)
+        keep = top > 0
+        return rows[keep], top[keep]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked row lists: score(row) = sum 1 / (k + rank). Best first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))
@@ -1,36 +1,171 @@
 import argparse
 import json
 import os
+import time
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from llama_index.core import Document, VectorStoreIndex, StorageContext
+import numpy as np
+from llama_index.core import Document, VectorStoreIndex
+from llama_index.core.schema import MetadataMode
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
+from ann_index import IVFIndex, pick_nprobe, recall_at_k, sample_queries
+from bm25_index import BM25Index
+from embed_pipeline import embed_texts
+from npy_store import (
+    MANIFEST_FILE,
+    STORE_DTYPES,
+    TRANSFORM_FILE,
+    VECTORS_FILE,
+    NpyVectorStore,
+    content_key,
+    load_reusable_vectors,
+    normalize_rows,
+    read_manifest,
+    top_k_rows,
+    update_manifest,
+    write_store,
+)
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_CHUNKS = PROJECT_ROOT / "data" / "llamaindex" / "chunks.jsonl"
 DEFAULT_PERSIST = PROJECT_ROOT / "data" / "llamaindex" / "storage"
 
 
-def load_chunks(jsonl_path: Path) -> List[Document]:
-    docs: List[Document] = []
+def load_records(jsonl_path: Path) -> List[dict]:
+    """Read chunks.jsonl into flat records: id, text and metadata (with a derived 'title')."""
+    records: List[dict] = []
     with jsonl_path.open("r", encoding="utf-8") as f:
-        for line in f:
+        for i, line in enumerate(f):
             rec = json.loads(line)
-            text = rec["text"]
             meta = rec.get("meta", {})
             section_path = meta.get("section_path", [])
             title = " / ".join(section_path) if section_path else meta.get("doc", "")
-            docs.append(
-                Document(
-                    text=text,
-                    metadata={
+            records.append(
+                {
+                    "id": rec.get("id") or f"chunk_{i:06d}",
+                    "text": rec["text"],
+                    "metadata": {
                         "title": title,
                         **meta,
                     },
-                )
+                }
             )
-    return docs
+    return records
+
+
+def embed_text(record: dict) -> str:
+    """Text that gets embedded: the chunk with its metadata (title, section_path, doc...) prepended,
+    exactly as VectorStoreIndex embeds a Document (MetadataMode.EMBED), so both stores match."""
+    return Document(text=record["text"], metadata=record["metadata"]).get_content(metadata_mode=MetadataMode.EMBED)
+
+
+def build_npy_store(
+    records: List[dict],
+    embed_model_id: str,
+    persist_dir: Path,
+    dtype: str,
+    incremental: bool = False,
+    batch_size: int = 32,
+    workers: int = 1,
+    pca_dim: Optional[int] = None,
+) -> None:
+    texts = [r["text"] for r in records]
+    # Keys follow the embedded text, so a metadata change re-embeds the chunk
+    inputs = [embed_text(r) for r in records]
+    keys = [content_key(t, embed_model_id) for t in inputs]
+    reusable = load_reusable_vectors(persist_dir, embed_model_id) if incremental else {}
+
+    # Only embed chunks whose (text, model) key is not in the previous manifest
+    missing = sorted({k: i for i, k in enumerate(keys) if k not in reusable}.values())
+    if incremental:
+        kept = len(set(keys) & reusable.keys())
+        dropped = len(reusable.keys() - set(keys))
+        print(f"Incremental: reuse {kept}, embed {len(missing)}, drop {dropped}")
+    else:
+        print(f"Embedding {len(texts)} chunks...")
+    fresh = {}
+    if missing:
+        embedded = embed_texts(
+            [inputs[i] for i in missing],
+            model_name=embed_model_id,
+            cache_folder=str(PROJECT_ROOT / ".cache"),
+            batch_size=batch_size,
+            workers=workers,
+        )
+        fresh = {keys[i]: v for i, v in zip(missing, embedded)}
+    vectors = np.stack([fresh[k] if k in fresh else reusable[k] for k in keys]) if keys else np.zeros((0, 0))
+    manifest = write_store(
+        persist_dir,
+        ids=[r["id"] for r in records],
+        texts=texts,
+        metadatas=[r["metadata"] for r in records],
+        vectors=vectors,
+        embed_model=embed_model_id,
+        dtype=dtype,
+        pca_dim=pca_dim,
+        keys=keys,
+    )
+    print(f"Wrote NumPy store: {manifest['count']} x {manifest['dim']} ({dtype})")
+    if manifest["count"] and (dtype != "float32" or manifest.get("transform") is not None):
+        compression_report(persist_dir, vectors)
+
+
+def compression_report(persist_dir: Path, full_vectors: np.ndarray, k: int = 8, n_queries: int = 200) -> None:
+    """Index size and recall@k of the stored (compressed) vectors against the full-precision originals."""
+    store = NpyVectorStore.load(persist_dir)
+    full = normalize_rows(full_vectors)
+    baseline_mb = full.shape[0] * full.shape[1] * 4 / 2**20
+    size_mb = (persist_dir / VECTORS_FILE).stat().st_size / 2**20
+    if (persist_dir / TRANSFORM_FILE).exists():
+        size_mb += (persist_dir / TRANSFORM_FILE).stat().st_size / 2**20
+    queries = sample_queries(full, n=n_queries)
+    hits = 0
+    for q in queries:
+        truth = set(top_k_rows(full @ q, k)[0].tolist())
+        hits += len(truth & set(store.search(q, k)[0].tolist()))
+    recall = hits / max(1, len(queries) * min(k, full.shape[0]))
+    info = store.manifest.get("transform") or {}
+    pca = f", PCA {full.shape[1]}->{info['pca_dim']} (energia {info['pca_energy']:.3f})" if info.get("pca_dim") else ""
+    print(
+        f"Compression: {store.vectors.dtype}{pca}: {size_mb:.1f} MB vs {baseline_mb:.1f} MB float32 "
+        f"(x{baseline_mb / max(size_mb, 1e-9):.1f}); recall@{k} vs full precision = {recall:.3f}"
+    )
+
+
+def build_bm25(records: List[dict], persist_dir: Path) -> None:
+    """Sparse lexical index over the same rows as the vector store (for hybrid retrieval)."""
+    bm25 = BM25Index.build((r["text"] for r in records), fingerprint=read_manifest(persist_dir).get("fingerprint", ""))
+    path = bm25.save(persist_dir)
+    print(f"Wrote BM25 index: {len(bm25.terms)} terms, {len(bm25.doc_ids)} postings -> {path.name}")
+
+
+def build_ivf(
+    persist_dir: Path,
+    nlist: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    target_recall: float = 0.95,
+    check_queries: int = 200,
+    k: int = 8,
+) -> None:
+    """IVF ANN index over the stored vectors; the recall@k self-check picks nprobe unless given."""
+    store = NpyVectorStore.load(persist_dir)
+    fingerprint = store.manifest.get("fingerprint", "")
+    mat = store.decode()  # compressed stores: cluster in the stored (PCA / dequantized) space
+    t0 = time.perf_counter()
+    ivf = IVFIndex.build(mat, nlist=nlist, fingerprint=fingerprint)
+    print(f"Built IVF index: nlist={ivf.nlist} in {time.perf_counter() - t0:.1f}s")
+    report = recall_at_k(store, ivf, sample_queries(mat, n=check_queries), k=k)
+    print(f"IVF self-check (recall@{k} vs exact, {check_queries} queries):")
+    for row in report:
+        print(
+            f"  nprobe={row['nprobe']:>4}  recall={row['recall']:.3f}  "
+            f"{row['ms_per_query']:.2f} ms/query  scanned={row['scanned']:.0f} rows"
+        )
+    ivf.nprobe = nprobe or pick_nprobe(report, target_recall)
+    path = ivf.save(persist_dir)
+    print(f"Wrote IVF index (default nprobe={ivf.nprobe}) -> {path.name}")
 
 
 def main():
@@ -45,8 +180,44 @@ def main():
         help="HuggingFace embedding model (multilingual recommended: BAAI/bge-m3)",
     )
     parser.add_argument("--batch-size", type=int, default=32, help="Embedding batch size")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="CPU worker processes for embedding (--store npy); each loads its own copy of the model",
+    )
+    parser.add_argument(
+        "--store",
+        choices=["npy", "simple"],
+        default="npy",
+        help="Vector store backend: 'npy' (mmap-able .npy matrix + JSONL sidecar) or 'simple' (legacy LlamaIndex JSON)",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=list(STORE_DTYPES),
+        default="float32",
+        help="Storage dtype for --store npy (int8 = per-dimension scalar quantization)",
+    )
+    parser.add_argument(
+        "--pca-dim",
+        type=int,
+        default=None,
+        help="Project vectors to this many PCA dimensions (--store npy); queries are projected automatically",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse vectors of unchanged chunks (hash of text + embed model) from the existing --store npy index",
+    )
+    parser.add_argument("--no-bm25", action="store_true", help="Skip the BM25 lexical index (bm25.npz) used by hybrid retrieval")
+    parser.add_argument("--ann", choices=["none", "ivf"], default="none", help="Also build an approximate index (ivf.npz) for --store npy")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(chunks))")
+    parser.add_argument("--nprobe", type=int, default=None, help="Default IVF lists probed per query (default: chosen by the self-check)")
+    parser.add_argument("--ann-target-recall", type=float, default=0.95, help="Recall@k the self-check aims for when choosing nprobe")
+    parser.add_argument("--ann-check-queries", type=int, default=200, help="Queries used by the IVF recall self-check")
     args = parser.parse_args()
 
+    t_start = time.perf_counter()
     chunks_path = Path(args.chunks).expanduser().resolve()
     if not chunks_path.exists():
         raise FileNotFoundError(f"Chunks not found: {chunks_path}")
@@ -55,13 +226,60 @@ def main():
     persist_dir.mkdir(parents=True, exist_ok=True)
 
     print(f"Loading chunks from: {chunks_path}")
-    documents = load_chunks(chunks_path)
-    print(f"Loaded documents: {len(documents)}")
+    records = load_records(chunks_path)
+    print(f"Loaded documents: {len(records)}")
 
     print(f"Loading embedding model: {args.embed_model}")
-    embed_model = HuggingFaceEmbedding(model_name=args.embed_model, cache_folder=str(PROJECT_ROOT / ".cache"))
-    # Optional: if future versions support batch size adjust, set here.
+    if args.store == "npy":
+        # Length-sorted batches, optionally fanned out over worker processes (see embed_pipeline)
+        print(f"Persisting NumPy store to: {persist_dir}")
+        build_npy_store(
+            records,
+            args.embed_model,
+            persist_dir,
+            args.dtype,
+            incremental=args.incremental,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            pca_dim=args.pca_dim,
+        )
+        if args.no_bm25:
+            # A bm25.npz from an earlier build would no longer match the store rows
+            BM25Index.remove(persist_dir)
+        else:
+            build_bm25(records, persist_dir)
+        if args.ann == "ivf" and records:
+            build_ivf(
+                persist_dir,
+                nlist=args.nlist,
+                nprobe=args.nprobe,
+                target_recall=args.ann_target_recall,
+                check_queries=args.ann_check_queries,
+            )
+        # Build stats for bench_retrieval.py
+        build_seconds = time.perf_counter() - t_start
+        update_manifest(
+            persist_dir,
+            build={
+                "seconds": round(build_seconds, 1),
+                "chunks_file": str(chunks_path),
+                "n_chunks": len(records),
+                "avg_chars": round(sum(len(r["text"]) for r in records) / max(1, len(records)), 1),
+                "incremental": args.incremental,
+            },
+        )
+        print(f"Done in {build_seconds:.1f}s.")
+        return
+
+    embed_model = HuggingFaceEmbedding(
+        model_name=args.embed_model,
+        cache_folder=str(PROJECT_ROOT / ".cache"),
+        embed_batch_size=args.batch_size,
+    )
 
+    # A leftover NumPy manifest would take precedence over the JSON store at load time
+    (persist_dir / MANIFEST_FILE).unlink(missing_ok=True)
+    documents = [Document(text=r["text"], metadata=r["metadata"]) for r in records]
     print("Building VectorStoreIndex...")
     index = VectorStoreIndex.from_documents(documents, embed_model=embed_model)
 
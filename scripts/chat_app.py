@@ -1,16 +1,26 @@
 import argparse
+import atexit
 import os
 import re
+import time
 from pathlib import Path
-from typing import List, Optional, Tuple
+from threading import Thread
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
-import torch
-import gradio as gr
-from transformers import AutoModelForCausalLM, AutoTokenizer
+# torch / transformers / gradio / llama_index se importan dentro de las funciones que los usan,
+# para que el servidor pueda arrancar mientras los modelos se cargan en segundo plano
+from context_packer import ContextBudget, pack_context
+from query_cache import QueryCache, index_fingerprint
+from startup import Deferred, Startup
+from telemetry import NULL_TRACE, Telemetry, TokenTimer, request_trace
 
-# RAG (optional)
-from llama_index.core import StorageContext, load_index_from_storage, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+if TYPE_CHECKING:
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from answer_cache import AnswerCache
+    from gen_batcher import GenerationBatcher
+    from kv_cache import PrefixKVCache
+    from speculative import DraftModel
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_PERSIST = PROJECT_ROOT / "data" / "llamaindex" / "storage"
@@ -26,14 +36,53 @@ def set_offline_mode(models_dir: Optional[Path], offline: bool):
         os.environ["HF_HUB_OFFLINE"] = "1"
 
 
-def load_qwen(model_id: str):
+CPU_QUANT_MODES = ("none", "int8", "bf16")
+
+
+def set_cpu_threads(threads: Optional[int]) -> int:
+    """Pin torch intra-op threads (default: all cores) and return the value in use."""
+    import torch
+
+    if threads and threads > 0:
+        torch.set_num_threads(threads)
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    return torch.get_num_threads()
+
+
+def load_cpu_model(src: str, quant: str = "none"):
+    """CPU model in float32, bfloat16 or dynamic int8 (Linear layers quantized to qint8)."""
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    if quant not in CPU_QUANT_MODES:
+        raise ValueError(f"CPU_QUANT desconocido: {quant} (opciones: {', '.join(CPU_QUANT_MODES)})")
+    if quant == "bf16":
+        try:
+            model = AutoModelForCausalLM.from_pretrained(src, torch_dtype=torch.bfloat16, device_map="cpu")
+            with torch.inference_mode():
+                model(input_ids=torch.tensor([[0]]))  # falla pronto si la CPU no soporta bf16
+            return model.eval()
+        except Exception as e:
+            print(f"[load_qwen] bf16 no disponible en esta CPU, se usa float32: {e}")
+            quant = "none"
+    model = AutoModelForCausalLM.from_pretrained(src, torch_dtype=torch.float32, device_map="cpu")
+    model.eval()
+    if quant == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def load_qwen(model_id: str, cpu_quant: Optional[str] = None, threads: Optional[int] = None):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
     local_path = Path(model_id) if os.path.isdir(model_id) else None
     src = str(local_path) if local_path else model_id
     tokenizer = AutoTokenizer.from_pretrained(src, use_fast=True)
 
-    # Preferir GPU (fp16) y caer a CPU (fp32) automáticamente si falla
+    # Preferir GPU (fp16) y caer a CPU automáticamente si falla o no hay GPU
     force_cpu = os.getenv("FORCE_CPU", "0").lower() in ("1", "true", "yes")
-    if not force_cpu:
+    if not force_cpu and torch.cuda.is_available():
         try:
             model = AutoModelForCausalLM.from_pretrained(
                 src,
@@ -44,13 +93,26 @@ def load_qwen(model_id: str):
         except Exception as e:
             print(f"[load_qwen] Fallback a CPU por error en GPU: {e}")
 
-    # CPU (estable)
-    model = AutoModelForCausalLM.from_pretrained(
-        src,
-        torch_dtype=torch.float32,
-        device_map="cpu",
-    )
-    return tokenizer, model
+    # CPU: cuantización y hilos configurables (CPU_QUANT=none|int8|bf16, CPU_THREADS=N)
+    quant = (cpu_quant or os.getenv("CPU_QUANT", "none")).lower()
+    if threads is None and os.getenv("CPU_THREADS"):
+        threads = int(os.environ["CPU_THREADS"])
+    n_threads = set_cpu_threads(threads)
+    print(f"[load_qwen] CPU: quant={quant}, hilos={n_threads}")
+    return tokenizer, load_cpu_model(src, quant)
+
+
+def cpu_loader_for(model_id: str, cpu_quant: Optional[str] = None):
+    """Loader of the CPU copy used by ModelManager when the accelerator fails."""
+    src = str(Path(model_id)) if os.path.isdir(model_id) else model_id
+    quant = (cpu_quant or os.getenv("CPU_QUANT", "none")).lower()
+
+    def _load():
+        print(f"[model_manager] Cargando copia en CPU de {model_id} (quant={quant})")
+        return load_cpu_model(src, quant)
+
+    return _load
+
 
 def format_prompt(system_prompt: str, history: List[Tuple[str, str]], user_msg: str, tokenizer) -> List[dict]:
     # Build chat markup for models supporting chat templates
@@ -293,46 +355,22 @@ def dedupe_lines(text: str) -> str:
     return "\n".join(out)
 
 def safe_generate(model, inputs, gen_kwargs):
-    import os, gc, torch
-    from transformers import AutoModelForCausalLM
+    """Generate through the ModelManager (swaps once to CPU on failure); plain models run as-is."""
+    import torch
 
-    try:
-        with torch.inference_mode():
-            return model.generate(**inputs, **gen_kwargs)
-    except Exception as e:
-        # Fallback: recarga el modelo en CPU float32 y reintenta
-        print(f"[safe_generate] GPU error, hard-fallback reload on CPU: {e}")
-        try:
-            src = getattr(getattr(model, "config", None), "_name_or_path", None)
-            if not src:
-                # último recurso: usa repr del config
-                src = str(model.config)
-            # liberar memoria GPU/estado
-            try:
-                torch.cuda.empty_cache()
-            except Exception:
-                pass
-            del model
-            gc.collect()
-            os.environ["CUDA_VISIBLE_DEVICES"] = ""  # evitar nuevas asignaciones CUDA
-            # mover inputs a CPU
-            inputs = {k: (v.cpu() if hasattr(v, "cpu") else v) for k, v in inputs.items()}
-            # recargar modelo en CPU
-            model_cpu = AutoModelForCausalLM.from_pretrained(
-                src,
-                torch_dtype=torch.float32,
-                device_map="cpu",
-            )
-            with torch.inference_mode():
-                return model_cpu.generate(**inputs, **gen_kwargs)
-        except Exception as e2:
-            print(f"[safe_generate] CPU reload failed: {e2}")
-            raise
-def generate(
+    from model_manager import ModelManager
+
+    if isinstance(model, ModelManager):
+        return model.generate(inputs, gen_kwargs)
+    with torch.inference_mode():
+        return model.generate(**inputs, **gen_kwargs)
+
+
+def prepare_generation(
     message: str,
     history: List[Tuple[str, str]],
-    tokenizer: AutoTokenizer,
-    model: AutoModelForCausalLM,
+    tokenizer: "AutoTokenizer",
+    model: "AutoModelForCausalLM",
     max_new_tokens: int,
     temperature: float,
     top_p: float,
@@ -341,13 +379,31 @@ def generate(
     rag_enabled: bool,
     retriever,
     force_zmat: bool,
-) -> str:
-    # Build RAG context if enabled
+    context_budget: Optional[ContextBudget] = None,
+    trace=NULL_TRACE,
+    sources: Optional[List[str]] = None,
+) -> Tuple[dict, dict]:
+    """Retrieve context, build the prompt and return (model inputs, generate kwargs).
+    The ids of the nodes placed in the prompt are appended to `sources` when given."""
+    only_input = wants_orca_input(message)
+    if context_budget is not None:
+        system_prompt, history = pack_prompt_parts(
+            message, history, tokenizer, rag_enabled, retriever, force_zmat, only_input, context_budget, trace, sources
+        )
+        return _tokenize_prompt(system_prompt, history, message, tokenizer, model, trace), _gen_kwargs(
+            tokenizer, max_new_tokens, temperature, top_p, top_k, repetition_penalty
+        )
+
+    # Legacy path: 5 snippets cut at 600 characters, full history
     rag_context = None
     if rag_enabled and retriever is not None and message.strip():
-        nodes = retriever.retrieve(message)
+        with trace.span("retrieve"):
+            nodes = retriever.retrieve(message)
+        trace.set(passages=len(nodes))
         snippets = []
         for n in nodes[:5]:
+            if sources is not None:
+                sources.append(n.node_id)
             text = n.get_text().strip()
             if len(text) > 600:
                 text = text[:600].rstrip() + " ???"
@@ -359,17 +415,68 @@ def generate(
                 snippets.append(text)
         rag_context = "\n---\n".join(snippets)
 
-    system_prompt = build_system_prompt(spanish_only=True, rag_context=rag_context)
-    only_input = wants_orca_input(message)
-    system_prompt = maybe_enhance_prompt_for_chem(
-        message, system_prompt, force_zmat=force_zmat, wants_input_only=only_input
+    with trace.span("format"):
+        system_prompt = build_system_prompt(spanish_only=True, rag_context=rag_context)
+        system_prompt = maybe_enhance_prompt_for_chem(
+            message, system_prompt, force_zmat=force_zmat, wants_input_only=only_input
+        )
+    return _tokenize_prompt(system_prompt, history, message, tokenizer, model, trace), _gen_kwargs(
+        tokenizer, max_new_tokens, temperature, top_p, top_k, repetition_penalty
     )
-    prompt = format_prompt(system_prompt, history, message, tokenizer)
 
-    inputs = tokenizer(prompt, return_tensors="pt")
-    inputs = {k: v.to(model.device) for k, v in inputs.items()}
 
-    gen_kwargs = {
+def pack_prompt_parts(
+    message: str,
+    history: List[Tuple[str, str]],
+    tokenizer: "AutoTokenizer",
+    rag_enabled: bool,
+    retriever,
+    force_zmat: bool,
+    only_input: bool,
+    budget: ContextBudget,
+    trace=NULL_TRACE,
+    sources: Optional[List[str]] = None,
+) -> Tuple[str, List[Tuple[str, str]]]:
+    """System prompt and history fitted to the token budget (see context_packer.pack_context)."""
+    passages = []
+    if rag_enabled and retriever is not None and message.strip():
+        with trace.span("retrieve"):
+            nodes = retriever.retrieve(message)
+        for n in nodes:
+            meta = n.metadata or {}
+            passages.append((meta.get("title") or "", n.get_text().strip()))
+            if sources is not None:
+                sources.append(n.node_id)
+        trace.set(passages=len(passages))
+    with trace.span("format"):
+        # Fixed part measured with an empty context placeholder
+        base = maybe_enhance_prompt_for_chem(
+            message, build_system_prompt(spanish_only=True, rag_context="-" if passages else None),
+            force_zmat=force_zmat, wants_input_only=only_input,
+        )
+        packed = pack_context(tokenizer, passages, history, message, base, budget)
+        system_prompt = build_system_prompt(spanish_only=True, rag_context=packed.rag_context)
+        if packed.history_summary:
+            system_prompt += "\n\nConversacion previa (resumen): " + packed.history_summary
+        system_prompt = maybe_enhance_prompt_for_chem(
+            message, system_prompt, force_zmat=force_zmat, wants_input_only=only_input
+        )
+    trace.set(dropped_turns=packed.dropped_turns)
+    return system_prompt, packed.history
+
+
+def _tokenize_prompt(system_prompt: str, history, message: str, tokenizer, model, trace=NULL_TRACE) -> dict:
+    with trace.span("format"):
+        prompt = format_prompt(system_prompt, history, message, tokenizer)
+    with trace.span("tokenize"):
+        inputs = tokenizer(prompt, return_tensors="pt")
+        inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    trace.set(tokens_in=int(inputs["input_ids"].shape[1]))
+    return inputs
+
+
+def _gen_kwargs(tokenizer, max_new_tokens, temperature, top_p, top_k, repetition_penalty) -> dict:
+    return {
         "max_new_tokens": max_new_tokens,
         "do_sample": temperature > 0.0,
         "temperature": max(temperature, 1e-6) if temperature > 0 else 1.0,
@@ -381,8 +488,43 @@ def generate(
         "no_repeat_ngram_size": 3,
     }
 
-    output_ids = safe_generate(model, inputs, gen_kwargs)
-    output_text = tokenizer.decode(output_ids[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+def static_prefix_ids(tokenizer, rag_enabled: bool) -> List[int]:
+    """Token ids shared by every prompt: render two different requests and keep their common prefix."""
+    from kv_cache import common_prefix_len
+
+    probes = []
+    for ctx, msg in (("a", "x"), ("b", "y")):
+        system_prompt = build_system_prompt(spanish_only=True, rag_context=ctx if rag_enabled else None)
+        prompt = format_prompt(system_prompt, [], msg, tokenizer)
+        probes.append(tokenizer(prompt)["input_ids"])
+    return probes[0][: common_prefix_len(probes[0], probes[1])]
+
+
+def attach_prefix_cache(kv_cache: Optional["PrefixKVCache"], inputs: dict, gen_kwargs: dict, session_id: Optional[str]) -> int:
+    """Reuse the past_key_values of the longest cached prefix (static prompt or this session).
+    Returns the number of prompt tokens covered by the reused cache."""
+    if kv_cache is None:
+        return 0
+    past, n = kv_cache.lookup(inputs["input_ids"][0].tolist(), session_id)
+    if past is not None:
+        gen_kwargs["past_key_values"] = past
+    if session_id:
+        # Necesario para recuperar la cache final y guardarla para el siguiente turno
+        gen_kwargs["return_dict_in_generate"] = True
+    return n
+
+
+def remember_session_cache(kv_cache: Optional["PrefixKVCache"], session_id: Optional[str], output):
+    """Store the session's final KV state (if any) and return the generated token ids."""
+    output_ids = getattr(output, "sequences", output)
+    past = getattr(output, "past_key_values", None)
+    if kv_cache is not None and session_id and past is not None:
+        kv_cache.store(session_id, output_ids[0].tolist(), past)
+    return output_ids
+
+
+def postprocess_output(message: str, output_text: str) -> str:
     # Simple cleanups
     output_text = output_text.strip()
     # If user explicitly asked for an ORCA input, avoid accidental Python and try to extract the code block
@@ -395,7 +537,205 @@ def generate(
     return output_text
 
 
-def create_interface(tokenizer, model, rag_enabled: bool, retriever, model_id: str, embed_model_id: str):
+def attach_draft(draft: Optional["DraftModel"], gen_kwargs: dict) -> bool:
+    """Add the assisted-generation kwargs of the draft model (not combined with a reused KV-cache)."""
+    if draft is None or "past_key_values" in gen_kwargs:
+        return False
+    extra = draft.gen_kwargs(gen_kwargs)
+    gen_kwargs.update(extra)
+    return bool(extra)
+
+
+def record_draft(draft: "DraftModel", counter, trace) -> None:
+    draft.record(counter)
+    trace.set(target_steps=counter.steps, tokens_per_step=round(counter.tokens / max(1, counter.steps), 2))
+
+
+def lookup_answer(
+    answer_cache: Optional["AnswerCache"], message: str, inputs: dict, sources: List[str], gen_kwargs: dict, trace
+) -> Tuple[Optional[str], Optional[str]]:
+    """(cached answer, key to store the new one under); (None, None) for stochastic requests."""
+    if answer_cache is None or not answer_cache.cacheable(gen_kwargs):
+        return None, None
+    key = answer_cache.make_key(message, inputs["input_ids"][0].tolist(), sources, gen_kwargs)
+    with trace.span("answer_cache"):
+        answer = answer_cache.get(key)
+    trace.set(answer_cache="hit" if answer is not None else "miss")
+    return answer, key
+
+
+def generate(
+    message: str,
+    history: List[Tuple[str, str]],
+    tokenizer: "AutoTokenizer",
+    model: "AutoModelForCausalLM",
+    max_new_tokens: int,
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    repetition_penalty: float,
+    rag_enabled: bool,
+    retriever,
+    force_zmat: bool,
+    kv_cache: Optional["PrefixKVCache"] = None,
+    session_id: Optional[str] = None,
+    batcher: Optional["GenerationBatcher"] = None,
+    context_budget: Optional[ContextBudget] = None,
+    telemetry: Optional[Telemetry] = None,
+    draft: Optional["DraftModel"] = None,
+    answer_cache: Optional["AnswerCache"] = None,
+) -> str:
+    with request_trace(telemetry, session_id) as trace:
+        sources: List[str] = []
+        inputs, gen_kwargs = prepare_generation(
+            message, history, tokenizer, model, max_new_tokens, temperature, top_p, top_k,
+            repetition_penalty, rag_enabled, retriever, force_zmat, context_budget, trace, sources,
+        )
+        answer, cache_key = lookup_answer(answer_cache, message, inputs, sources, gen_kwargs, trace)
+        if answer is not None:
+            return answer
+        answer = _generate_answer(
+            message, tokenizer, model, inputs, gen_kwargs, kv_cache, session_id, batcher, draft, telemetry, trace
+        )
+        if cache_key is not None:
+            answer_cache.put(cache_key, answer)
+        return answer
+
+
+def _generate_answer(message, tokenizer, model, inputs, gen_kwargs, kv_cache, session_id, batcher, draft, telemetry, trace) -> str:
+    n_prompt = inputs["input_ids"].shape[1]
+    trace.set(cached_tokens=attach_prefix_cache(kv_cache, inputs, gen_kwargs, session_id))
+    drafting = attach_draft(draft, gen_kwargs)
+    if batcher is not None and not drafting and "past_key_values" not in gen_kwargs:
+        # Sin KV-cache reutilizable: agrupar con otras peticiones concurrentes
+        batch_kwargs = {k: v for k, v in gen_kwargs.items() if k != "return_dict_in_generate"}
+        with trace.span("generate_batched"):
+            new_ids = batcher.submit(inputs["input_ids"][0].tolist(), batch_kwargs).result()
+        trace.set(tokens_out=len(new_ids))
+        with trace.span("postprocess"):
+            return postprocess_output(message, tokenizer.decode(new_ids, skip_special_tokens=True))
+    # Separa prefill y decode por el instante del primer token generado
+    timer = TokenTimer() if telemetry is not None else None
+    counter = None
+    if drafting:
+        from speculative import StepCounter
+
+        counter = StepCounter(inner=timer)
+    streamer = counter or timer
+    output = safe_generate(model, inputs, {**gen_kwargs, "streamer": streamer} if streamer else gen_kwargs)
+    if timer is not None:
+        timer.record(trace)
+    if counter is not None:
+        record_draft(draft, counter, trace)
+    output_ids = remember_session_cache(kv_cache, session_id, output)
+    trace.set(tokens_out=int(output_ids.shape[1] - n_prompt))
+    with trace.span("postprocess"):
+        output_text = tokenizer.decode(output_ids[0][n_prompt:], skip_special_tokens=True)
+        return postprocess_output(message, output_text)
+
+
+def generate_stream(
+    message: str,
+    history: List[Tuple[str, str]],
+    tokenizer: "AutoTokenizer",
+    model: "AutoModelForCausalLM",
+    max_new_tokens: int,
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    repetition_penalty: float,
+    rag_enabled: bool,
+    retriever,
+    force_zmat: bool,
+    kv_cache: Optional["PrefixKVCache"] = None,
+    session_id: Optional[str] = None,
+    context_budget: Optional[ContextBudget] = None,
+    telemetry: Optional[Telemetry] = None,
+    draft: Optional["DraftModel"] = None,
+    answer_cache: Optional["AnswerCache"] = None,
+) -> Iterator[str]:
+    """Like generate(), but yields the partial answer as tokens arrive.
+    The ORCA post-processing only runs on the final yield.
+    """
+    with request_trace(telemetry, session_id) as trace:
+        sources: List[str] = []
+        inputs, gen_kwargs = prepare_generation(
+            message, history, tokenizer, model, max_new_tokens, temperature, top_p, top_k,
+            repetition_penalty, rag_enabled, retriever, force_zmat, context_budget, trace, sources,
+        )
+        answer, cache_key = lookup_answer(answer_cache, message, inputs, sources, gen_kwargs, trace)
+        if answer is not None:
+            yield answer
+            return
+        n_prompt = inputs["input_ids"].shape[1]
+        trace.set(cached_tokens=attach_prefix_cache(kv_cache, inputs, gen_kwargs, session_id), stream=True)
+        from transformers import TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        counter = None
+        if attach_draft(draft, gen_kwargs):
+            from speculative import StepCounter
+
+            counter = StepCounter(inner=streamer)
+        errors: List[Exception] = []
+        n_out: List[int] = []
+
+        def _run():
+            try:
+                output = safe_generate(model, inputs, {**gen_kwargs, "streamer": counter or streamer})
+                n_out.append(int(remember_session_cache(kv_cache, session_id, output).shape[1] - n_prompt))
+            except Exception as e:
+                errors.append(e)
+                # Desbloquear el iterador si generate fallo antes de cerrar el streamer
+                streamer.end()
+
+        thread = Thread(target=_run, daemon=True)
+        t_start = time.perf_counter()
+        t_first = None
+        thread.start()
+        partial = ""
+        for piece in streamer:
+            if t_first is None and piece:
+                # Prefill ~ tiempo hasta el primer texto visible
+                t_first = time.perf_counter()
+                trace.add_span("prefill", t_first - t_start)
+            partial += piece
+            yield partial
+        thread.join()
+        if t_first is not None:
+            trace.add_span("decode", time.perf_counter() - t_first)
+        if errors:
+            raise errors[0]
+        trace.set(tokens_out=n_out[0] if n_out else None)
+        if counter is not None:
+            record_draft(draft, counter, trace)
+        with trace.span("postprocess"):
+            final = postprocess_output(message, partial)
+        if cache_key is not None:
+            answer_cache.put(cache_key, final)
+        yield final
+
+
+def create_interface(
+    tokenizer,
+    model,
+    rag_enabled: bool,
+    retriever,
+    model_id: str,
+    embed_model_id: str,
+    stream: bool = False,
+    kv_cache: Optional["PrefixKVCache"] = None,
+    batcher: Optional["GenerationBatcher"] = None,
+    context_budget: Optional[ContextBudget] = None,
+    startup: Optional[Startup] = None,
+    telemetry: Optional[Telemetry] = None,
+    draft: Optional["DraftModel"] = None,
+    answer_cache: Optional["AnswerCache"] = None,
+):
+    """Chat UI. With `startup`, the model/retriever come from its background loaders and requests
+    get a readiness message until they have finished."""
+    import gradio as gr
+
     # Controls
     max_new_tokens = gr.Slider(minimum=64, maximum=2048, step=64, value=512, label="Max tokens respuesta")
     temperature = gr.Slider(minimum=0.0, maximum=1.0, step=0.05, value=0.05, label="Temperature")
@@ -404,22 +744,65 @@ def create_interface(tokenizer, model, rag_enabled: bool, retriever, model_id: s
     repetition_penalty = gr.Slider(minimum=1.0, maximum=2.0, step=0.01, value=1.15, label="Repetition penalty")
     force_zmat = gr.Checkbox(value=False, label="Incluir Z-matrix si aplica")
 
-    def _respond(message, history, ui_max_new_tokens, ui_temperature, ui_top_p, ui_top_k, ui_rep_pen, ui_force_zmat):
-        return generate(
+    def _resources():
+        """(tokenizer, model, retriever, kv_cache, batcher) in use."""
+        if startup is None:
+            return tokenizer, model, retriever, kv_cache, batcher
+        llm = startup.result("llm")
+        rag_retriever = startup.result("index") if rag_enabled else None
+        return llm["tokenizer"], llm["model"], rag_retriever, llm["kv_cache"], llm["batcher"]
+
+    def _draft():
+        return draft if startup is None else startup.result("llm").get("draft")
+
+    def _not_ready() -> Optional[str]:
+        if startup is None or startup.ready():
+            return None
+        if startup.failed():
+            return f"Error al cargar el servicio. Estado: {startup.status()}"
+        return f"El servicio se esta iniciando; vuelve a intentarlo en unos segundos. Estado: {startup.status()}"
+
+    def _gen_args(message, history, ui_max_new_tokens, ui_temperature, ui_top_p, ui_top_k, ui_rep_pen, ui_force_zmat, request):
+        tok, mdl, rag_retriever, kv, _ = _resources()
+        return dict(
             message=message,
             history=history or [],
-            tokenizer=tokenizer,
-            model=model,
+            tokenizer=tok,
+            model=mdl,
             max_new_tokens=int(ui_max_new_tokens),
             temperature=float(ui_temperature),
             top_p=float(ui_top_p),
             top_k=int(ui_top_k),
             repetition_penalty=float(ui_rep_pen),
             rag_enabled=rag_enabled,
-            retriever=retriever,
+            retriever=rag_retriever,
             force_zmat=bool(ui_force_zmat),
+            kv_cache=kv,
+            session_id=getattr(request, "session_hash", None),
+            context_budget=context_budget,
+            telemetry=telemetry,
+            draft=_draft(),
+            answer_cache=answer_cache,
         )
 
+    def _respond(message, history, ui_max_new_tokens, ui_temperature, ui_top_p, ui_top_k, ui_rep_pen, ui_force_zmat,
+                 request: gr.Request = None):
+        pending = _not_ready()
+        if pending:
+            return pending
+        return generate(**_gen_args(message, history, ui_max_new_tokens, ui_temperature, ui_top_p, ui_top_k,
+                                    ui_rep_pen, ui_force_zmat, request), batcher=_resources()[4])
+
+    def _respond_stream(message, history, ui_max_new_tokens, ui_temperature, ui_top_p, ui_top_k, ui_rep_pen,
+                        ui_force_zmat, request: gr.Request = None):
+        # Generador: gr.ChatInterface muestra cada texto parcial según llega
+        pending = _not_ready()
+        if pending:
+            yield pending
+            return
+        yield from generate_stream(**_gen_args(message, history, ui_max_new_tokens, ui_temperature, ui_top_p,
+                                               ui_top_k, ui_rep_pen, ui_force_zmat, request))
+
     # Examples must include values for each additional input, in order
     examples = [
         ["�Qu� es DLPNO-CCSD(T) en ORCA?", 512, 0.1, 0.9, 50, 1.08, False],
@@ -428,7 +811,7 @@ def create_interface(tokenizer, model, rag_enabled: bool, retriever, model_id: s
     ]
 
     chat = gr.ChatInterface(
-        fn=_respond,
+        fn=_respond_stream if stream else _respond,
         title=f"Chat RAG - {model_id}",
         description=(f"Modelo chat: {model_id} | Embeddings: {embed_model_id}. Responde en espanol. "
                      + ("RAG activado: usa el indice LlamaIndex." if rag_enabled else "RAG desactivado: chat base.")),
@@ -438,6 +821,16 @@ def create_interface(tokenizer, model, rag_enabled: bool, retriever, model_id: s
     return chat
 
 
+def queue_app(app, concurrency: int):
+    """Enable the Gradio queue letting `concurrency` requests run at once (so the batcher sees them)."""
+    if concurrency <= 1:
+        return app.queue()
+    try:
+        return app.queue(default_concurrency_limit=concurrency)  # Gradio 4.x
+    except TypeError:
+        return app.queue(concurrency_count=concurrency)  # Gradio 3.x
+
+
 def main():
     parser = argparse.ArgumentParser(description="Gradio chat app con Qwen 0.5B y RAG opcional")
     parser.add_argument("--model-id", default="Qwen/Qwen2.5-0.5B-Instruct", help="HF model id")
@@ -448,22 +841,141 @@ def main():
     parser.add_argument("--offline", action="store_true", help="Forzar modo offline (HF_HUB_OFFLINE=1)")
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--cpu-quant", choices=CPU_QUANT_MODES, default=None, help="Modo de inferencia en CPU (por defecto $CPU_QUANT o none)")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de torch en CPU (por defecto $CPU_THREADS o todos los nucleos)")
+    parser.add_argument("--preload-cpu", action="store_true", help="Cargar al arrancar la copia en CPU de respaldo (si no, se carga al primer fallo)")
+    parser.add_argument("--stream", action="store_true", help="Mostrar la respuesta token a token (streaming)")
+    parser.add_argument("--kv-cache", action="store_true", help="Reutilizar la KV-cache del system prompt fijo y de cada sesion")
+    parser.add_argument("--kv-cache-tokens", type=int, default=8192, help="Tokens maximos en caches de sesion (LRU)")
+    parser.add_argument("--kv-cache-sessions", type=int, default=8, help="Sesiones maximas con KV-cache")
+    parser.add_argument("--max-batch-size", type=int, default=1, help="Peticiones agrupadas por llamada a generate (1 = sin batching)")
+    parser.add_argument("--max-batch-wait-ms", type=float, default=30.0, help="Espera maxima para completar un lote (ms)")
+    parser.add_argument("--hybrid", action="store_true", help="Fusionar BM25 (bm25.npz) con la busqueda densa via RRF")
+    parser.add_argument("--top-k", type=int, default=8, help="Pasajes recuperados (tras la fusion si --hybrid)")
+    parser.add_argument("--dense-top-k", type=int, default=None, help="Candidatos densos antes de la fusion (por defecto --top-k)")
+    parser.add_argument("--ann", action="store_true", help="Usar el indice aproximado IVF (ivf.npz) si existe")
+    parser.add_argument("--nprobe", type=int, default=None, help="Listas IVF exploradas por consulta (por defecto la elegida al construir)")
+    parser.add_argument("--rerank-model", default=None, help="Cross-encoder local para reordenar (p.ej. cross-encoder/mmarco-mMiniLMv2-L12-H384-v1)")
+    parser.add_argument("--rerank-candidates", type=int, default=20, help="Candidatos recuperados antes del reranking")
+    parser.add_argument("--rerank-top-n", type=int, default=4, help="Pasajes que se conservan tras el reranking")
+    parser.add_argument("--rerank-budget-ms", type=float, default=None, help="Presupuesto de latencia del reranker por consulta (ms)")
+    parser.add_argument("--query-cache", type=int, default=256, help="Entradas LRU de cache de consultas RAG (0 = desactivada)")
+    parser.add_argument("--query-cache-file", default=None, help="Fichero JSON para persistir la cache de consultas entre reinicios")
+    parser.add_argument("--answer-cache", default=str(PROJECT_ROOT / ".cache" / "answer_cache.sqlite"), help="Fichero SQLite de la cache de respuestas deterministas")
+    parser.add_argument("--answer-cache-mb", type=float, default=64.0, help="Tamaño maximo de la cache de respuestas en MB (0 = desactivada)")
+    parser.add_argument("--answer-cache-max-temp", type=float, default=0.0, help="Temperatura maxima para cachear respuestas muestreadas (0 = solo greedy, que siempre se cachea)")
+    parser.add_argument("--context-tokens", type=int, default=3072, help="Presupuesto total del prompt en tokens (0 = recorte fijo de 600 caracteres)")
+    parser.add_argument("--passage-tokens", type=int, default=1536, help="Tokens maximos para los pasajes recuperados")
+    parser.add_argument("--history-tokens", type=int, default=768, help="Tokens maximos para el historial (mas lo que no usen los pasajes)")
+    parser.add_argument("--fast-start", action="store_true", help="Abrir el puerto de inmediato y cargar modelos e indice en segundo plano")
+    parser.add_argument("--draft-model", default=None, help="Modelo pequeño para generacion asistida/especulativa (p. ej. Qwen/Qwen2.5-0.5B-Instruct); mismas respuestas en greedy")
+    parser.add_argument("--draft-tokens", type=int, default=0, help="Tokens propuestos por paso del borrador (0 = ajuste automatico de transformers)")
+    parser.add_argument("--telemetry-log", default=None, help="Fichero JSONL con una traza por peticion (tiempos por etapa, tokens, errores)")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Puerto local para /metrics en formato Prometheus (0 = desactivado)")
     args = parser.parse_args()
 
     # Offline/cache
     set_offline_mode(Path(args.models_dir) if args.models_dir else None, args.offline)
+    persist_dir = Path(args.persist).expanduser().resolve()
+    if args.rag and not persist_dir.exists():
+        raise FileNotFoundError(f"Persist dir no encontrado: {persist_dir}")
 
-    # Cargar modelo
-    print(f"Cargando modelo: {args.model_id}")
-    tokenizer, model = load_qwen(args.model_id)
+    telemetry = None
+    if args.telemetry_log or args.metrics_port:
+        telemetry = Telemetry(Path(args.telemetry_log) if args.telemetry_log else None)
+        if args.metrics_port:
+            telemetry.serve_metrics(args.metrics_port)
+            print(f"[telemetry] Metricas en http://127.0.0.1:{args.metrics_port}/metrics")
+
+    # LLM, embeddings, indice y reranker se cargan a la vez en hilos de fondo
+    startup = Startup()
+    # Se decide por flags y no tras la carga (diferida): la concurrencia de Gradio depende de ello.
+    # Sin batcher, las peticiones concurrentes llamarian a generate sobre el modelo y la KV-cache compartidos
+    # (con --kv-cache toda peticion lleva past_key_values y nunca pasaria por el batcher)
+    use_batcher = args.max_batch_size > 1 and not args.stream and not args.draft_model and not args.kv_cache
+
+    def _load_llm():
+        print(f"Cargando modelo: {args.model_id}")
+        from model_manager import ModelManager
+
+        tokenizer, model = load_qwen(args.model_id, cpu_quant=args.cpu_quant, threads=args.threads)
+        # Una sola instancia viva compartida; ante un fallo se cambia una vez a CPU
+        manager = ModelManager(model, cpu_loader=cpu_loader_for(args.model_id, args.cpu_quant), preload_cpu=args.preload_cpu)
+        del model
+        atexit.register(lambda: print(f"[model_manager] {manager.stats()}"))
+        if telemetry is not None:
+            telemetry.add_gauge("model_downgrades", lambda: manager.downgrades)
+            telemetry.add_gauge("model_on_cpu", lambda: int(manager.on_cpu))
+
+        draft = None
+        if args.draft_model:
+            from speculative import DraftModel
+
+            print(f"Cargando modelo borrador: {args.draft_model}")
+            draft_tokenizer, draft_model = load_qwen(args.draft_model, cpu_quant=args.cpu_quant, threads=args.threads)
+            draft = DraftModel(
+                draft_model, draft_tokenizer, tokenizer, num_tokens=args.draft_tokens,
+                cpu_loader=cpu_loader_for(args.draft_model, args.cpu_quant),
+            )
+            del draft_model
+            if manager.on_cpu:
+                # El borrador debe estar en el mismo dispositivo que el modelo principal
+                draft.to_cpu()
+            draft.check(manager.model, tokenizer("Hola", return_tensors="pt")["input_ids"])
+            if draft.enabled:
+                manager.on_downgrade(draft.to_cpu)
+                atexit.register(lambda: print(f"[draft] {draft.stats()}"))
+                if telemetry is not None:
+                    telemetry.add_gauge("draft_tokens_per_step", lambda: draft.stats()["tokens_per_step"])
+                print(f"[draft] Generacion asistida con {args.draft_model} (vocabulario {'compartido' if draft.same_vocab else 'distinto: solo greedy'})")
+                if args.kv_cache or args.max_batch_size > 1:
+                    print("[draft] --kv-cache y --max-batch-size se ignoran con --draft-model")
+            else:
+                draft = None
+
+        kv_cache = None
+        if args.kv_cache and draft is None:
+            from kv_cache import PrefixKVCache
+
+            kv_cache = PrefixKVCache(max_tokens=args.kv_cache_tokens, max_sessions=args.kv_cache_sessions)
+            prefix_ids = static_prefix_ids(tokenizer, rag_enabled=args.rag)
+            try:
+                n = kv_cache.warm(manager.model, prefix_ids)
+                print(f"[kv_cache] Prefijo estatico precalculado: {n} tokens")
+            except Exception as e:
+                print(f"[kv_cache] Desactivada (el modelo no admite reutilizar la cache): {e}")
+                kv_cache = None
+        if kv_cache is not None:
+            def _reset_kv_cache(cpu_model):
+                # Las caches viven en el dispositivo anterior: se descartan y se recalcula el prefijo
+                kv_cache.clear()
+                kv_cache.warm(cpu_model, prefix_ids)
+
+            manager.on_downgrade(_reset_kv_cache)
+            if telemetry is not None:
+                telemetry.add_gauge("kv_cache_hits", lambda: kv_cache.hits)
+                telemetry.add_gauge("kv_cache_reused_tokens", lambda: kv_cache.reused_tokens)
+
+        batcher = None
+        if args.max_batch_size > 1 and args.stream and not args.draft_model:
+            print("[batcher] Ignorado con --stream (las respuestas en streaming no se agrupan)")
+        elif args.max_batch_size > 1 and args.kv_cache and draft is None:
+            print("[batcher] Ignorado con --kv-cache (las peticiones reutilizan la cache del prefijo, no se agrupan)")
+        elif use_batcher:
+            from gen_batcher import GenerationBatcher
+
+            batcher = GenerationBatcher(
+                manager, tokenizer, safe_generate, max_batch_size=args.max_batch_size, max_wait_ms=args.max_batch_wait_ms
+            )
+            print(f"[batcher] Lotes de hasta {args.max_batch_size} peticiones, espera maxima {args.max_batch_wait_ms} ms")
+            if telemetry is not None:
+                telemetry.add_gauge("batch_avg_size", lambda: batcher.requests / max(1, batcher.batches))
+        return {"tokenizer": tokenizer, "model": manager, "kv_cache": kv_cache, "batcher": batcher, "draft": draft}
+
+    def _load_embedder():
+        from llama_index.core import Settings
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
-    # RAG opcional
-    retriever = None
-    if args.rag:
-        persist_dir = Path(args.persist).expanduser().resolve()
-        if not persist_dir.exists():
-            raise FileNotFoundError(f"Persist dir no encontrado: {persist_dir}")
-        print(f"Cargando �ndice LlamaIndex desde: {persist_dir}")
         # Inyectar embeddings (debe coincidir con build-time). Permitir ruta local
         embed_src = str(Path(args.embed_model)) if os.path.isdir(args.embed_model) else args.embed_model
         embed_model = HuggingFaceEmbedding(
@@ -471,29 +983,110 @@ def main():
             cache_folder=str(PROJECT_ROOT / ".cache"),
         )
         Settings.embed_model = embed_model
-        storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
-        index = load_index_from_storage(storage_context)
-        retriever = index.as_retriever(similarity_top_k=8)
-
-    # UI
-    app = create_interface(tokenizer, model, rag_enabled=args.rag, retriever=retriever, model_id=args.model_id, embed_model_id=args.embed_model)
-    app.queue().launch(server_name=args.host, server_port=args.port, share=False, show_error=True, debug=True)
-
-
-if __name__ == "__main__":
-    main()
-
+        return embed_model
 
+    def _load_reranker():
+        from reranker import CrossEncoderReranker
 
+        print(f"Cargando reranker: {args.rerank_model}")
+        return CrossEncoderReranker(args.rerank_model, cache_folder=str(PROJECT_ROOT / ".cache"))
 
+    def _load_index():
+        from npy_store import is_npy_store
+        from retrievers import RerankingRetriever, load_retriever
 
+        print(f"Cargando �ndice LlamaIndex desde: {persist_dir}")
+        # El store npy solo guarda el modelo de embeddings: no hace falta esperar a que termine de cargar
+        if is_npy_store(persist_dir):
+            embed_model = Deferred(startup.future("embedder"))
+        else:
+            embed_model = startup.result("embedder")
+        query_cache = None
+        if args.query_cache > 0:
+            query_cache = QueryCache(
+                max_entries=args.query_cache,
+                path=Path(args.query_cache_file) if args.query_cache_file else None,
+                fingerprint=index_fingerprint(persist_dir),
+            )
 
+            def _save_query_cache():
+                query_cache.save()
+                print(f"[query_cache] {query_cache.stats()}")
 
+            atexit.register(_save_query_cache)
+            if telemetry is not None:
+                telemetry.add_gauge("query_cache_hit_rate", lambda: query_cache.stats()["hit_rate"])
+        retriever = load_retriever(
+            persist_dir,
+            embed_model,
+            # Con reranker se recupera un conjunto de candidatos mas amplio
+            similarity_top_k=args.rerank_candidates if args.rerank_model else args.top_k,
+            query_cache=query_cache,
+            hybrid=args.hybrid,
+            dense_top_k=args.dense_top_k,
+            ann=args.ann,
+            nprobe=args.nprobe,
+        )
+        if args.rerank_model:
+            retriever = RerankingRetriever(
+                retriever, startup.result("reranker"), top_n=args.rerank_top_n, budget_ms=args.rerank_budget_ms
+            )
+        return retriever
 
+    startup.start("llm", _load_llm)
+    if args.rag:
+        startup.start("embedder", _load_embedder)
+        if args.rerank_model:
+            startup.start("reranker", _load_reranker)
+        startup.start("index", _load_index)
 
+    answer_cache = None
+    if args.answer_cache_mb > 0:
+        from answer_cache import AnswerCache
 
+        # Un espacio por modelo e indice: solo se invalida el suyo si ese indice se ha reconstruido
+        answer_cache = AnswerCache(
+            Path(args.answer_cache),
+            model_id=args.model_id,
+            fingerprint=index_fingerprint(persist_dir) if args.rag else "",
+            namespace=f"{args.model_id}|{persist_dir if args.rag else 'sin-rag'}",
+            max_mb=args.answer_cache_mb,
+            max_temperature=args.answer_cache_max_temp,
+        )
+        atexit.register(lambda: print(f"[answer_cache] {answer_cache.stats()}"))
+        if telemetry is not None:
+            telemetry.add_gauge("answer_cache_hit_rate", lambda: answer_cache.stats()["hit_rate"])
 
+    context_budget = None
+    if args.context_tokens > 0:
+        context_budget = ContextBudget(
+            total=args.context_tokens, passages=args.passage_tokens, history=args.history_tokens
+        )
 
+    with startup.phase("import gradio"):
+        import gradio  # noqa: F401
+    if not args.fast_start:
+        startup.wait()
 
+    # UI
+    with startup.phase("ui"):
+        app = create_interface(
+            None,
+            None,
+            rag_enabled=args.rag,
+            retriever=None,
+            model_id=args.model_id,
+            embed_model_id=args.embed_model,
+            stream=args.stream,
+            context_budget=context_budget,
+            startup=startup,
+            telemetry=telemetry,
+            answer_cache=answer_cache,
+        )
+    if args.fast_start:
+        print(f"[startup] Abriendo el servidor en t={time.perf_counter() - startup.t0:.2f} s; modelos cargando en segundo plano")
+    queue_app(app, concurrency=args.max_batch_size if use_batcher else 1).launch(server_name=args.host, server_port=args.port, share=False, show_error=True, debug=True)
 
 
+if __name__ == "__main__":
+    main()
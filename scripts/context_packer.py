@@ -0,0 +1,153 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+# Sentence boundaries: end punctuation followed by whitespace, or a blank line
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;:])\s+|\n\s*\n")
+_WS_RE = re.compile(r"\s+")
+
+
+@dataclass
+class ContextBudget:
+    """Prompt token budget: `total` covers system prompt, passages, history and the user message."""
+
+    total: int = 3072
+    passages: int = 1536
+    history: int = 768
+    summary: int = 64
+
+
+@dataclass
+class PackedContext:
+    rag_context: Optional[str]
+    history: List[Tuple[str, str]]
+    history_summary: str = ""
+    dropped_turns: int = 0
+    tokens: dict = field(default_factory=dict)
+
+
+def count_tokens(tokenizer, text: str) -> int:
+    if not text:
+        return 0
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+
+
+def sentence_segments(text: str) -> List[str]:
+    """Sentences with their trailing separator kept, so "".join(segments) == text (newlines survive)."""
+    segments: List[str] = []
+    start = 0
+    for m in SENTENCE_SPLIT_RE.finditer(text):
+        segments.append(text[start : m.end()])
+        start = m.end()
+    if start < len(text):
+        segments.append(text[start:])
+    return segments
+
+
+def trim_to_tokens(tokenizer, text: str, max_tokens: int) -> str:
+    """Longest prefix of whole sentences within max_tokens (hard token cut if even one does not fit)."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(tokenizer, text) <= max_tokens:
+        return text
+    segments = sentence_segments(text)
+    lo, hi = 0, len(segments)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(tokenizer, "".join(segments[:mid]).rstrip()) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    if lo > 0:
+        return "".join(segments[:lo]).rstrip()
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"][:max_tokens]
+    return tokenizer.decode(ids, skip_special_tokens=True).rstrip() + " …"
+
+
+def dedupe_passages(passages: Sequence[Tuple[str, str]], min_chars: int = 40) -> List[Tuple[str, str]]:
+    """Drop sentences already seen in a higher-ranked passage (overlapping chunks repeat text)."""
+    seen = set()
+    out: List[Tuple[str, str]] = []
+    for title, text in passages:
+        kept = []
+        for seg in sentence_segments(text):
+            key = _WS_RE.sub(" ", seg).strip().lower()
+            if len(key) >= min_chars:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(seg)
+        body = "".join(kept).strip()
+        if body:
+            out.append((title, body))
+    return out
+
+
+def summarize_turns(tokenizer, turns: Sequence[Tuple[str, str]], max_tokens: int) -> str:
+    """Extractive summary of dropped turns: the first sentence of each user question."""
+    firsts = [(split_sentences(u) or [u])[0] for u, _ in turns if u]
+    if not firsts or max_tokens <= 0:
+        return ""
+    return trim_to_tokens(tokenizer, "; ".join(firsts), max_tokens)
+
+
+def pack_context(
+    tokenizer,
+    passages: Sequence[Tuple[str, str]],
+    history: Sequence[Tuple[str, str]],
+    user_msg: str,
+    system_text: str,
+    budget: ContextBudget,
+) -> PackedContext:
+    """Fit ranked passages and the most recent history into the token budget.
+    Passages are deduplicated and trimmed at sentence boundaries; the oldest turns are dropped
+    first and summarized in a short line. Unused passage budget is handed to history.
+    """
+    fixed = count_tokens(tokenizer, system_text) + count_tokens(tokenizer, user_msg)
+    free = max(0, budget.total - fixed)
+
+    # Passages, best first
+    passage_budget = min(budget.passages, free)
+    used = 0
+    snippets: List[str] = []
+    for title, text in dedupe_passages(passages):
+        header = f"[{title}]\n" if title else ""
+        remaining = passage_budget - used - count_tokens(tokenizer, header + "\n---\n")
+        if remaining < 32:
+            break
+        body = trim_to_tokens(tokenizer, text, remaining)
+        if not body:
+            break
+        snippets.append(header + body)
+        used += count_tokens(tokenizer, header + body + "\n---\n")
+    rag_context = "\n---\n".join(snippets) if snippets else None
+
+    # History, newest first, within what is left
+    history_budget = min(budget.history + (passage_budget - used), free - used)
+    turns = list(history)
+    costs = [count_tokens(tokenizer, u or "") + count_tokens(tokenizer, a or "") + 8 for u, a in turns]  # + template
+    if sum(costs) > history_budget:
+        # Some turns will be dropped: keep room for their one-line summary
+        history_budget -= budget.summary
+    kept: List[Tuple[str, str]] = []
+    h_used = 0
+    for turn, cost in zip(reversed(turns), reversed(costs)):
+        if h_used + cost > history_budget:
+            break
+        kept.append(turn)
+        h_used += cost
+    kept.reverse()
+    dropped = turns[: len(turns) - len(kept)]
+    summary = summarize_turns(tokenizer, dropped, budget.summary)
+
+    return PackedContext(
+        rag_context=rag_context,
+        history=kept,
+        history_summary=summary,
+        dropped_turns=len(dropped),
+        tokens={"fixed": fixed, "passages": used, "history": h_used, "budget": budget.total},
+    )
@@ -1,10 +1,13 @@
+import argparse
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions, RapidOcrOptions
 
+from convert_jobs import LEDGER_FILE, JobLedger, run_conversions, write_output
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 SPLITS_ROOT = PROJECT_ROOT / "output" / "pdf_splits"  # cada subcarpeta tiene trozos *_partNNN.pdf
 MD_OUT = PROJECT_ROOT / "output" / "md_out"
@@ -20,24 +23,50 @@ def list_pdfs(folder: Path) -> List[Path]:
     return sorted([p for p in folder.glob("*.pdf") if p.is_file()])
 
 
-def main() -> None:
-    MD_OUT.mkdir(parents=True, exist_ok=True)
-    split_folders = find_split_folders(SPLITS_ROOT)
+# Un DocumentConverter por proceso (creado en init_worker)
+_CONVERTER: Optional[DocumentConverter] = None
 
-    if not split_folders:
-        print(f"No se encontraron subcarpetas en: {SPLITS_ROOT}. Primero usa scripts/split_pdf.py")
-        return
 
+def init_worker() -> None:
+    global _CONVERTER
+    if _CONVERTER is not None:
+        return
     pdf_opts = PdfPipelineOptions()
     pdf_opts.ocr_options = RapidOcrOptions()
-    converter = DocumentConverter(
+    _CONVERTER = DocumentConverter(
         format_options={
             InputFormat.PDF: PdfFormatOption(pipeline_options=pdf_opts),
         }
     )
 
+
+def convert_job(pdf_path: str, out_path: str) -> Tuple[bool, Optional[str]]:
+    pdf, out_md = Path(pdf_path), Path(out_path)
+    try:
+        print(f"[CONVIERTIENDO] {pdf.parent.name} / {pdf.name} -> {out_md.relative_to(PROJECT_ROOT)}")
+        result = _CONVERTER.convert(str(pdf))
+        write_output(out_md, result.document.export_to_markdown())
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convertir todos los trozos de output/pdf_splits/<doc>/ a Markdown")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos de conversión en paralelo")
+    parser.add_argument("--resume", action="store_true", help="Saltar trozos ya convertidos (mtime/hash en el ledger)")
+    args = parser.parse_args()
+
+    MD_OUT.mkdir(parents=True, exist_ok=True)
+    split_folders = find_split_folders(SPLITS_ROOT)
+
+    if not split_folders:
+        print(f"No se encontraron subcarpetas en: {SPLITS_ROOT}. Primero usa scripts/split_pdf.py")
+        return
+
     total_ok = 0
     total_files = 0
+    total_skipped = 0
 
     for fold in split_folders:
         pdfs = list_pdfs(fold)
@@ -47,18 +76,21 @@ def main() -> None:
         doc_out = MD_OUT / fold.name
         doc_out.mkdir(parents=True, exist_ok=True)
 
-        for pdf in pdfs:
-            total_files += 1
-            out_md = doc_out / (pdf.stem + ".md")
-            try:
-                print(f"[CONVIERTIENDO] {fold.name} / {pdf.name} -> {out_md.relative_to(PROJECT_ROOT)}")
-                result = converter.convert(str(pdf))
-                out_md.write_text(result.document.export_to_markdown(), encoding="utf-8")
-                total_ok += 1
-            except Exception as e:
-                print(f"[ERROR] {fold.name} / {pdf.name}: {e}")
-
-    print(f"Listo. Convertidos: {total_ok}/{total_files}. Salidas en: {MD_OUT}")
+        jobs = [(pdf, doc_out / (pdf.stem + ".md")) for pdf in pdfs]
+        ok, skipped = run_conversions(
+            jobs,
+            init_fn=init_worker,
+            init_args=(),
+            convert_fn=convert_job,
+            workers=args.workers,
+            resume=args.resume,
+            ledger=JobLedger(doc_out / LEDGER_FILE),
+        )
+        total_files += len(pdfs)
+        total_ok += ok
+        total_skipped += skipped
+
+    print(f"Listo. Convertidos: {total_ok}/{total_files - total_skipped} (saltados: {total_skipped}). Salidas en: {MD_OUT}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LEDGER_FILE = ".convert_ledger.json"
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_output(path: Path, text: str) -> None:
+    """Write a conversion output atomically (tmp + replace): an interrupted job never leaves a
+    truncated file that --resume would take as finished."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+
+class JobLedger:
+    """Per-output-folder record of converted PDFs, rewritten after every finished job."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8")).get("jobs", {})
+            except Exception as e:
+                print(f"[LEDGER] Ignorando ledger ilegible {self.path}: {e}")
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"jobs": self.entries}, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def record(self, pdf: Path, out_path: Path, ok: bool, seconds: float, error: Optional[str] = None) -> None:
+        self.entries[pdf.name] = {
+            "output": out_path.name,
+            "sha256": file_sha256(pdf) if ok else None,
+            "status": "done" if ok else "error",
+            "seconds": round(seconds, 2),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "error": error,
+        }
+        self.save()
+
+    def skip_reason(self, pdf: Path, out_path: Path) -> Optional[str]:
+        """Why this job can be skipped on resume, or None if it must run."""
+        entry = self.entries.get(pdf.name)
+        # With a ledger entry only a "done" record counts; mtime is the fallback for older outputs
+        if not out_path.exists() or (entry and entry.get("status") != "done"):
+            return None
+        if out_path.stat().st_mtime >= pdf.stat().st_mtime:
+            return "salida mas reciente que el PDF"
+        if entry and entry.get("status") == "done" and entry.get("output") == out_path.name:
+            if entry.get("sha256") == file_sha256(pdf):
+                return "hash sin cambios"
+        return None
+
+
+def run_conversions(
+    jobs: Sequence[Tuple[Path, Path]],
+    init_fn: Callable,
+    init_args: tuple,
+    convert_fn: Callable[[str, str], Tuple[bool, Optional[str]]],
+    workers: int = 1,
+    resume: bool = False,
+    ledger: Optional[JobLedger] = None,
+) -> Tuple[int, int]:
+    """Run (pdf, out_path) jobs serially or on a process pool; each worker builds its own converter
+    via init_fn(*init_args) and converts with convert_fn(pdf, out). Returns (ok, skipped).
+    """
+    pending: List[Tuple[Path, Path]] = []
+    skipped = 0
+    for pdf, out_path in jobs:
+        reason = ledger.skip_reason(pdf, out_path) if (resume and ledger) else None
+        if reason:
+            print(f"[SALTADO] {pdf.name}: {reason}")
+            skipped += 1
+        else:
+            pending.append((pdf, out_path))
+
+    ok = 0
+
+    def finish(pdf: Path, out_path: Path, success: bool, error: Optional[str], seconds: float) -> None:
+        nonlocal ok
+        if success:
+            ok += 1
+            print(f"[OK] {pdf.name} ({seconds:.1f}s)")
+        else:
+            print(f"[ERROR] {pdf.name}: {error}")
+        if ledger is not None:
+            ledger.record(pdf, out_path, success, seconds, error)
+
+    if workers <= 1 or len(pending) <= 1:
+        if pending:
+            init_fn(*init_args)
+        for pdf, out_path in pending:
+            t0 = time.perf_counter()
+            success, error = convert_fn(str(pdf), str(out_path))
+            finish(pdf, out_path, success, error, time.perf_counter() - t0)
+        return ok, skipped
+
+    print(f"[POOL] {len(pending)} trabajos en {workers} procesos")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=init_fn,
+        initargs=init_args,
+    ) as pool:
+        futures = {pool.submit(_timed, convert_fn, str(pdf), str(out)): (pdf, out) for pdf, out in pending}
+        for fut in as_completed(futures):
+            pdf, out_path = futures[fut]
+            try:
+                success, error, seconds = fut.result()
+            except Exception as e:
+                success, error, seconds = False, str(e), 0.0
+            finish(pdf, out_path, success, error, seconds)
+    return ok, skipped
+
+
+def _timed(convert_fn: Callable, pdf: str, out: str) -> Tuple[bool, Optional[str], float]:
+    t0 = time.perf_counter()
+    success, error = convert_fn(pdf, out)
+    return success, error, time.perf_counter() - t0
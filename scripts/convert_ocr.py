@@ -9,6 +9,8 @@ from docling.datamodel.pipeline_options import (
     TesseractCliOcrOptions,
 )
 
+from ocr_triage import report_path, summary, triage_pdf, write_report
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_OUT_DIR = PROJECT_ROOT / "output" / "md_out"
 
@@ -19,9 +21,17 @@ def convert_pdf(
     full_page_ocr: bool = False,
     ocr_backend: str = "rapidocr",
     tess_lang: str = "eng",
+    ocr_auto: bool = False,
 ) -> None:
     pdf_opts = PdfPipelineOptions()
     pdf_opts.do_ocr = True
+    if ocr_auto and not full_page_ocr:
+        # Skip OCR entirely when every page already has a usable text layer
+        decisions = triage_pdf(input_path)
+        report = write_report(decisions, report_path(output_path, input_path), input_path)
+        s = summary(decisions)
+        pdf_opts.do_ocr = s["ocr_pages"] > 0
+        print(f"OCR triage: {s['ocr_pages']}/{s['pages']} pages need OCR -> do_ocr={pdf_opts.do_ocr} (report: {report})")
     if ocr_backend == "rapidocr":
         pdf_opts.ocr_options = RapidOcrOptions(force_full_page_ocr=full_page_ocr)
     elif ocr_backend == "tesseract_cli":
@@ -61,6 +71,11 @@ def main():
         default="eng",
         help="Tesseract language code(s), e.g., 'eng', 'spa', 'eng+spa' (only for tesseract_cli)",
     )
+    parser.add_argument(
+        "--ocr-auto",
+        action="store_true",
+        help="Check each page for a text layer first and disable OCR if no page needs it (writes <pdf>.ocr_pages.json)",
+    )
     args = parser.parse_args()
 
     in_path = Path(args.input).expanduser().resolve()
@@ -80,6 +95,7 @@ def main():
         full_page_ocr=args.full_ocr,
         ocr_backend=args.ocr_backend,
         tess_lang=args.tess_lang,
+        ocr_auto=args.ocr_auto,
     )
 
 
@@ -0,0 +1,203 @@
+import argparse
+import inspect
+import multiprocessing as mp
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from docling.datamodel.base_models import DocumentStream
+from docling.document_converter import DocumentConverter
+
+from convert_all import DATA_IN, MD_OUT, add_docling_args, build_converter, build_pipeline_options, log_options
+from ocr_triage import ocr_runs, report_path, summary, triage_pdf, write_report
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except Exception:
+    raise SystemExit("Falta 'pypdf'. Instala con: .\\.venv\\Scripts\\python -m pip install pypdf")
+
+_BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.S | re.I)
+
+# DocumentConverter(s) del proceso, por modo de OCR (creados al primer uso)
+_CONVERTERS: Dict[Optional[bool], DocumentConverter] = {}
+_OPTS: dict = {}
+_PAGE_RANGE = False
+
+
+def supports_page_range() -> bool:
+    """Docling reciente acepta convert(..., page_range=(ini, fin)) y conserva los números de página originales."""
+    try:
+        return "page_range" in inspect.signature(DocumentConverter.convert).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def page_ranges(total: int, pages_per_job: int, first: int = 1) -> List[Tuple[int, int]]:
+    """Rangos 1-based inclusivos que cubren las páginas [first, total] en orden."""
+    return [(start, min(start + pages_per_job - 1, total)) for start in range(first, total + 1, pages_per_job)]
+
+
+def init_worker(opts: dict) -> None:
+    global _OPTS, _PAGE_RANGE
+    _OPTS = opts
+    _PAGE_RANGE = supports_page_range()
+
+
+def _converter(ocr: Optional[bool]) -> DocumentConverter:
+    """Convertidor del proceso; con --ocr-auto hay uno con OCR y otro sin él, creados al primer uso."""
+    if ocr not in _CONVERTERS:
+        _CONVERTERS[ocr] = build_converter(_OPTS, ocr=ocr)
+    return _CONVERTERS[ocr]
+
+
+def _convert(pdf: Path, start: int, end: int, ocr: Optional[bool] = None):
+    """(DoclingDocument, desplazamiento de página) del rango, sin escribir nada a disco."""
+    converter = _converter(ocr)
+    if _PAGE_RANGE:
+        return converter.convert(str(pdf), page_range=(start, end)).document, 0
+    # Versiones sin page_range: el rango se recorta en memoria y las páginas empiezan en 1
+    reader = PdfReader(str(pdf))
+    writer = PdfWriter()
+    for i in range(start - 1, end):
+        writer.add_page(reader.pages[i])
+    buf = BytesIO()
+    writer.write(buf)
+    buf.seek(0)
+    stream = DocumentStream(name=f"{pdf.stem}_p{start:04d}-{end:04d}.pdf", stream=buf)
+    return converter.convert(stream).document, start - 1
+
+
+def convert_range(
+    pdf_path: str, start: int, end: int, ocr: Optional[bool] = None
+) -> Tuple[int, int, List[Tuple[int, str]], Optional[str], float]:
+    """Convierte las páginas [start, end] y exporta cada una por separado: (start, end, [(página, texto)], error, s)."""
+    t0 = time.perf_counter()
+    try:
+        doc, offset = _convert(Path(pdf_path), start, end, ocr)
+        html = bool(_OPTS.get("export_html")) and hasattr(doc, "export_to_html")
+        pages = []
+        for page_no in range(start, end + 1):
+            if html:
+                m = _BODY_RE.search(doc.export_to_html(page_no=page_no - offset))
+                text = m.group(1).strip() if m else ""
+            else:
+                text = doc.export_to_markdown(page_no=page_no - offset).strip()
+            pages.append((page_no, text))
+        return start, end, pages, None, time.perf_counter() - t0
+    except Exception as e:
+        return start, end, [], str(e), time.perf_counter() - t0
+
+
+def _convert_task(task: Tuple[str, int, int, Optional[bool]]):
+    return convert_range(*task)
+
+
+def convert_pdf_pages(pdf: Path, out_path: Path, opts: dict, pages_per_job: int, workers: int) -> Tuple[int, List[str]]:
+    """Reparte el PDF original por rangos de páginas entre procesos Docling y escribe un único documento
+    en orden de página a medida que llegan los rangos, con un marcador `<!-- page N -->` por página."""
+    total = len(PdfReader(str(pdf)).pages)
+    if opts.get("ocr_auto"):
+        # Los rangos no mezclan páginas con y sin OCR: cada uno va al convertidor que le toca
+        decisions = triage_pdf(pdf)
+        write_report(decisions, report_path(out_path, pdf), pdf)
+        s = summary(decisions)
+        print(f"[OCR] {pdf.name}: OCR en {s['ocr_pages']}/{s['pages']} páginas (informe {report_path(out_path, pdf).name})")
+        tasks = [
+            (str(pdf), start, end, ocr)
+            for first, last, ocr in ocr_runs(decisions)
+            for start, end in page_ranges(last, pages_per_job, first)
+        ]
+    else:
+        tasks = [(str(pdf), start, end, None) for start, end in page_ranges(total, pages_per_job)]
+    workers = max(1, min(workers, len(tasks)))
+    html = bool(opts.get("export_html"))
+    print(f"[PAGES] {pdf.name}: {total} páginas en {len(tasks)} rangos de hasta {pages_per_job}, {workers} procesos")
+
+    errors: List[str] = []
+    done = 0
+    t0 = time.perf_counter()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fout:
+        if html:
+            fout.write(f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{pdf.stem}</title>\n</head>\n<body>\n')
+
+        if workers == 1:
+            init_worker(opts)
+            results = map(_convert_task, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(opts,),
+            )
+            # map() devuelve en orden de página: cada rango se escribe en cuanto sus anteriores están listos
+            results = pool.map(_convert_task, tasks)
+        try:
+            for start, end, pages, error, seconds in results:
+                if error is not None:
+                    errors.append(f"páginas {start}-{end}: {error}")
+                    print(f"[ERROR] páginas {start}-{end}: {error}")
+                    fout.write(f"\n<!-- pages {start}-{end}: conversion failed -->\n")
+                    continue
+                for page_no, text in pages:
+                    fout.write(f"\n<!-- page {page_no} -->\n")
+                    if text:
+                        fout.write(text + "\n")
+                done += end - start + 1
+                rate = done / max(time.perf_counter() - t0, 1e-9)
+                print(f"[OK] páginas {start}-{end} ({seconds:.1f}s) - {done}/{total} ({rate:.2f} pág/s)")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if html:
+            fout.write("</body>\n</html>\n")
+    tmp.replace(out_path)
+    return done, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convertir un PDF por rangos de páginas en paralelo con Docling, sin escribir PDFs partidos"
+    )
+    parser.add_argument("input", help="PDF original (si das solo el nombre se busca en data/pdf_in)")
+    parser.add_argument("--out", default=None, help="Fichero de salida (default: output/md_out/<nombre>.md o .html)")
+    parser.add_argument("--pages-per-job", type=int, default=10, help="Páginas por rango enviado a cada proceso")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos Docling en paralelo (un DocumentConverter por proceso)")
+    add_docling_args(parser)
+    args = parser.parse_args()
+
+    # Resolver entrada igual que split_pdf.py
+    in_candidate = Path(args.input)
+    if not in_candidate.suffix:
+        in_candidate = in_candidate.with_suffix(".pdf")
+    pdf = in_candidate.resolve() if in_candidate.is_absolute() else (DATA_IN / in_candidate).resolve()
+    if not pdf.exists() and Path(args.input).exists():
+        pdf = Path(args.input).resolve()
+    if not pdf.exists():
+        raise FileNotFoundError(f"No existe el archivo: {pdf}")
+
+    ext = ".html" if args.export_html else ".md"
+    out_path = Path(args.out).expanduser().resolve() if args.out else MD_OUT / (pdf.stem + ext)
+
+    opts = vars(args)
+    log_options(build_pipeline_options(opts))
+    if args.assets_dir or args.keep_captions:
+        print("[PAGES] --assets-dir y --keep-captions solo se aplican en convert_all.py (exportación del documento completo)")
+    print(f"[Docling] page_range nativo: {'sí' if supports_page_range() else 'no (rangos recortados en memoria)'}")
+
+    t0 = time.perf_counter()
+    done, errors = convert_pdf_pages(pdf, out_path, opts, max(1, args.pages_per_job), args.workers)
+    print(f"Listo. {done} páginas en {time.perf_counter() - t0:.1f}s -> {out_path}")
+    if errors:
+        raise SystemExit(f"{len(errors)} rangos fallidos: " + "; ".join(errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Per-process embedding model (each worker holds its own HuggingFaceEmbedding)
+_WORKER_MODEL = None
+
+
+def load_embed_model(model_name: str, cache_folder: Optional[str], batch_size: int):
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=model_name, cache_folder=cache_folder, embed_batch_size=batch_size)
+
+
+def _init_worker(model_name: str, cache_folder: Optional[str], batch_size: int, threads: int) -> None:
+    global _WORKER_MODEL
+    import torch
+
+    # Split the cores between workers instead of letting every process grab all of them
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = load_embed_model(model_name, cache_folder, batch_size)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _WORKER_MODEL.get_text_embedding_batch(texts)
+
+
+def length_sorted_batches(texts: Sequence[str], batch_size: int) -> List[List[int]]:
+    """Group indices into batches of similar length so tokenizer padding stays minimal."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def embed_texts(
+    texts: Sequence[str],
+    model_name: str,
+    cache_folder: Optional[str] = None,
+    batch_size: int = 32,
+    workers: int = 1,
+    embed_model=None,
+    log_every: int = 20,
+) -> np.ndarray:
+    """Embed texts in length-sorted batches, optionally across N CPU worker processes.
+    Returns a float32 matrix in the original order of `texts` and prints chunks/sec.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    batch_size = max(1, batch_size)
+    batches = length_sorted_batches(texts, batch_size)
+    payloads = [[texts[i] for i in b] for b in batches]
+    out: Optional[np.ndarray] = None
+    done = 0
+    t0 = time.perf_counter()
+
+    def place(batch_idx: int, vecs) -> None:
+        nonlocal out, done
+        arr = np.asarray(vecs, dtype=np.float32)
+        if out is None:
+            out = np.zeros((len(texts), arr.shape[1]), dtype=np.float32)
+        out[batches[batch_idx]] = arr
+        done += len(batches[batch_idx])
+        if log_every and ((batch_idx + 1) % log_every == 0 or done == len(texts)):
+            rate = done / max(time.perf_counter() - t0, 1e-9)
+            print(f"[embed] {done}/{len(texts)} chunks ({rate:.1f} chunks/s)")
+
+    if workers <= 1:
+        model = embed_model or load_embed_model(model_name, cache_folder, batch_size)
+        for bi, payload in enumerate(payloads):
+            place(bi, model.get_text_embedding_batch(payload))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"[embed] {workers} workers x {threads} threads, batch_size={batch_size}, batches={len(batches)}")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, cache_folder, batch_size, threads),
+        ) as pool:
+            for bi, vecs in enumerate(pool.map(_embed_batch, payloads)):
+                place(bi, vecs)
+
+    elapsed = time.perf_counter() - t0
+    print(f"[embed] {len(texts)} chunks in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/s)")
+    return out
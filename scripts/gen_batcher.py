@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence, Set
+
+import torch
+
+
+@dataclass
+class _Pending:
+    input_ids: List[int]
+    gen_kwargs: dict
+    future: Future = field(default_factory=Future)
+
+
+def _params_key(gen_kwargs: dict) -> tuple:
+    return tuple(sorted((k, repr(v)) for k, v in gen_kwargs.items()))
+
+
+def _until_stop(ids: List[int], stop_ids: Set[int]) -> List[int]:
+    """New tokens of one batch row up to and including its first eos/pad: rows that finish early
+    are padded until the longest one ends, and that padding is not generated output."""
+    for i, tok in enumerate(ids):
+        if tok in stop_ids:
+            return ids[: i + 1]
+    return ids
+
+
+class GenerationBatcher:
+    """Background worker that groups concurrent requests into one padded model.generate call.
+    Requests are collected for up to max_wait_ms (or until max_batch_size), grouped by identical
+    generation parameters, left-padded and decoded together; each caller gets its own new tokens.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        generate_fn: Callable,
+        max_batch_size: int = 4,
+        max_wait_ms: float = 30.0,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.generate_fn = generate_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.batches = 0
+        self.requests = 0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="gen-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids: Sequence[int], gen_kwargs: dict) -> Future:
+        """Queue one prompt; the future resolves to the list of generated token ids."""
+        item = _Pending(list(input_ids), dict(gen_kwargs))
+        self._queue.put(item)
+        return item.future
+
+    def _collect(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            groups: Dict[tuple, List[_Pending]] = {}
+            for item in self._collect():
+                groups.setdefault(_params_key(item.gen_kwargs), []).append(item)
+            for items in groups.values():
+                self._run(items)
+
+    def _run(self, items: List[_Pending]) -> None:
+        try:
+            max_len = max(len(it.input_ids) for it in items)
+            # Left padding keeps every prompt's last token aligned for decoding
+            ids = torch.full((len(items), max_len), self.pad_id, dtype=torch.long)
+            mask = torch.zeros((len(items), max_len), dtype=torch.long)
+            for i, it in enumerate(items):
+                ids[i, max_len - len(it.input_ids):] = torch.tensor(it.input_ids, dtype=torch.long)
+                mask[i, max_len - len(it.input_ids):] = 1
+            inputs = {"input_ids": ids.to(self.model.device), "attention_mask": mask.to(self.model.device)}
+            output = self.generate_fn(self.model, inputs, items[0].gen_kwargs)
+            output_ids = getattr(output, "sequences", output)
+            self.batches += 1
+            self.requests += len(items)
+            stop_ids = self._stop_ids(items[0].gen_kwargs)
+            for i, it in enumerate(items):
+                it.future.set_result(_until_stop(output_ids[i][max_len:].tolist(), stop_ids))
+        except Exception as e:
+            for it in items:
+                if not it.future.done():
+                    it.future.set_exception(e)
+
+    def _stop_ids(self, gen_kwargs: dict) -> Set[int]:
+        eos = gen_kwargs.get("eos_token_id", self.tokenizer.eos_token_id)
+        stop = set(eos) if isinstance(eos, (list, tuple, set)) else {eos}
+        stop.add(self.pad_id)
+        stop.discard(None)
+        return stop
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,123 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+
+STATIC_KEY = "__static__"
+
+
+def common_prefix_len(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _as_cache(past):
+    """Normalize generate()/forward() past_key_values to a croppable DynamicCache."""
+    if past is None:
+        return None
+    if hasattr(past, "crop"):
+        return past
+    from transformers import DynamicCache
+
+    return DynamicCache.from_legacy_cache(past)
+
+
+class PrefixKVCache:
+    """Reuse past_key_values for prompts that share a token prefix with an earlier one.
+    A pinned entry holds the static system prompt; per-session entries hold the last
+    conversation state and are evicted LRU once the total cached tokens exceed max_tokens.
+    """
+
+    def __init__(self, max_tokens: int = 8192, max_sessions: int = 8):
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self._entries: "OrderedDict[str, Tuple[List[int], object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def warm(self, model, prefix_ids: Sequence[int]) -> int:
+        """Prefill the static prefix once and pin it."""
+        if not prefix_ids:
+            return 0
+        ids = torch.tensor([list(prefix_ids)], device=model.device)
+        with torch.inference_mode():
+            out = model(input_ids=ids, use_cache=True)
+        cache = _as_cache(out.past_key_values)
+        with self._lock:
+            self._entries[STATIC_KEY] = (list(prefix_ids), cache)
+        return len(prefix_ids)
+
+    def lookup(self, input_ids: Sequence[int], session_id: Optional[str] = None):
+        """Return (cache copy cropped to the longest shared prefix, n_tokens) or (None, 0)."""
+        ids = list(input_ids)
+        with self._lock:
+            candidates = [STATIC_KEY] + ([session_id] if session_id in self._entries else [])
+            best_key, best_len = None, 0
+            for key in candidates:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                n = common_prefix_len(entry[0], ids)
+                if n > best_len:
+                    best_key, best_len = key, n
+            # generate() needs at least one uncached token to produce logits
+            best_len = min(best_len, len(ids) - 1)
+            if best_key is None or best_len <= 0:
+                self.misses += 1
+                return None, 0
+            if best_key != STATIC_KEY:
+                self._entries.move_to_end(best_key)
+            cache = copy.deepcopy(self._entries[best_key][1])
+        try:
+            cache.crop(best_len)
+        except Exception as e:
+            print(f"[kv_cache] No se pudo recortar la cache ({type(cache).__name__}): {e}")
+            return None, 0
+        with self._lock:
+            self.hits += 1
+            self.reused_tokens += best_len
+        return cache, best_len
+
+    def store(self, session_id: str, sequence: Sequence[int], past) -> None:
+        """Remember the conversation state of a session (tokens covered by `past`)."""
+        cache = _as_cache(past)
+        if cache is None or not session_id:
+            return
+        n = int(cache.get_seq_length())
+        ids = list(sequence)[:n]
+        with self._lock:
+            self._entries[session_id] = (ids, cache)
+            self._entries.move_to_end(session_id)
+            self._evict()
+
+    def clear(self) -> None:
+        """Drop every entry, including the pinned static prefix."""
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self) -> None:
+        def sessions():
+            return [k for k in self._entries if k != STATIC_KEY]
+
+        def total_tokens():
+            return sum(len(ids) for ids, _ in self._entries.values())
+
+        while sessions() and (len(sessions()) > self.max_sessions or total_tokens() > self.max_tokens):
+            self._entries.pop(sessions()[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len([k for k in self._entries if k != STATIC_KEY]),
+                "cached_tokens": sum(len(ids) for ids, _ in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reused_tokens": self.reused_tokens,
+            }
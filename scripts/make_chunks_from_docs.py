@@ -1,55 +1,30 @@
 import argparse
 import json
+import multiprocessing as mp
 import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from html.parser import HTMLParser
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Iterable, List, Optional, Sequence, Tuple
 
-# -------- Helpers for HTML to text (stdlib only) ---------
-class _TextExtractor(HTMLParser):
-    def __init__(self) -> None:
-        super().__init__()
-        self._chunks: List[str] = []
-        self._in_script_style = False
+# -------- Helpers for HTML to text + figures (stdlib only) ---------
+_BLOCK_START = frozenset(("p", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5"))
+_BLOCK_END = frozenset(("p", "li", "tr"))
+_NEWLINES_RE = re.compile(r"\r\n?|\u00A0")
+_SPACES_RE = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
 
-    def handle_starttag(self, tag, attrs):
-        if tag in ("script", "style"):
-            self._in_script_style = True
-        if tag in ("p", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5"):
-            self._chunks.append("\n")
 
-    def handle_endtag(self, tag):
-        if tag in ("script", "style"):
-            self._in_script_style = False
-        if tag in ("p", "li", "tr"):
-            self._chunks.append("\n")
+class _DocParser(HTMLParser):
+    """Single pass over the HTML: plain text (script/style dropped) and <figure> img src + figcaption."""
 
-    def handle_data(self, data):
-        if self._in_script_style:
-            return
-        self._chunks.append(data)
-
-    def get_text(self) -> str:
-        s = "".join(self._chunks)
-        # Normalize spaces and newlines
-        s = re.sub(r"\r\n?|\u00A0", "\n", s)
-        s = re.sub(r"[ \t\f\v]+", " ", s)
-        s = re.sub(r"\n{3,}", "\n\n", s)
-        return s.strip()
-
-
-def html_to_text(html: str) -> str:
-    parser = _TextExtractor()
-    parser.feed(html)
-    return parser.get_text()
-
-
-# --------- Figure harvesting (very light, stdlib) ----------
-class _FigureHarvester(HTMLParser):
     def __init__(self) -> None:
         super().__init__()
+        self._chunks: List[str] = []
+        self._in_script_style = False
         self.in_figure = False
         self.in_figcaption = False
         self.current_src: Optional[str] = None
@@ -57,20 +32,29 @@ class _FigureHarvester(HTMLParser):
         self.items: List[dict] = []
 
     def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._in_script_style = True
+        if tag in _BLOCK_START:
+            self._chunks.append("\n")
         if tag == "figure":
             self.in_figure = True
             self.current_src = None
             self.current_caption_chunks = []
-        if self.in_figure and tag == "img":
-            for k, v in attrs:
-                if k == "src":
-                    self.current_src = v
-        if self.in_figure and tag == "figcaption":
-            self.in_figcaption = True
-        if self.in_figure and tag in ("br",):
-            self.current_caption_chunks.append("\n")
+        elif self.in_figure:
+            if tag == "img":
+                for k, v in attrs:
+                    if k == "src":
+                        self.current_src = v
+            elif tag == "figcaption":
+                self.in_figcaption = True
+            elif tag == "br":
+                self.current_caption_chunks.append("\n")
 
     def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._in_script_style = False
+        if tag in _BLOCK_END:
+            self._chunks.append("\n")
         if tag == "figcaption":
             self.in_figcaption = False
         if tag == "figure":
@@ -83,13 +67,36 @@ class _FigureHarvester(HTMLParser):
     def handle_data(self, data):
         if self.in_figure and self.in_figcaption:
             self.current_caption_chunks.append(data)
+        if self._in_script_style:
+            return
+        self._chunks.append(data)
+
+    def get_text(self) -> str:
+        s = "".join(self._chunks)
+        # Normalize spaces and newlines
+        s = _NEWLINES_RE.sub("\n", s)
+        s = _SPACES_RE.sub(" ", s)
+        s = _BLANK_LINES_RE.sub("\n\n", s)
+        return s.strip()
+
+    def get_figures(self) -> List[dict]:
+        # remove empties
+        return [it for it in self.items if (it.get("caption") or it.get("src"))]
+
+
+def parse_html(html: str) -> Tuple[str, List[dict]]:
+    """(text, figures) from one parse of the document."""
+    parser = _DocParser()
+    parser.feed(html)
+    return parser.get_text(), parser.get_figures()
+
+
+def html_to_text(html: str) -> str:
+    return parse_html(html)[0]
 
 
 def harvest_figures(html: str) -> List[dict]:
-    h = _FigureHarvester()
-    h.feed(html)
-    # remove empties
-    return [it for it in h.items if (it.get("caption") or it.get("src"))]
+    return parse_html(html)[1]
 
 
 # --------- Chunking ----------
@@ -121,17 +128,17 @@ def split_into_chunks(text: str, cfg: ChunkerCfg) -> Iterable[str]:
 
 # --------- Main pipeline ----------
 
-def process_file(path: Path, assets_root: Optional[Path], cfg: ChunkerCfg, out, base_doc: str):
+def chunk_file(path: Path, assets_root: Optional[Path], cfg: ChunkerCfg, base_doc: str) -> List[str]:
+    """JSON lines (text chunks, then figure mini-chunks) for one converted file; ids only depend on the file."""
     text: str = ""
     figs: List[dict] = []
     raw = path.read_text(encoding="utf-8", errors="ignore")
     if path.suffix.lower() == ".html":
-        text = html_to_text(raw)
-        figs = harvest_figures(raw)
+        text, figs = parse_html(raw)
     else:
         # Markdown: take as-is
         text = raw
-    # Write text chunks
+    lines: List[str] = []
     rel = path.as_posix()
     idx = 0
     for chunk in split_into_chunks(text, cfg):
@@ -143,9 +150,9 @@ def process_file(path: Path, assets_root: Optional[Path], cfg: ChunkerCfg, out,
                 "source_path": rel,
             },
         }
-        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        lines.append(json.dumps(rec, ensure_ascii=False))
         idx += 1
-    # Write figure items as mini-chunks (caption + asset path)
+    # Figure items as mini-chunks (caption + asset path)
     for item in figs:
         cap = (item.get("caption") or "").strip()
         src = item.get("src")
@@ -166,8 +173,33 @@ def process_file(path: Path, assets_root: Optional[Path], cfg: ChunkerCfg, out,
                 "type": "figure",
             },
         }
-        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        lines.append(json.dumps(rec, ensure_ascii=False))
         idx += 1
+    return lines
+
+
+def process_file(path: Path, assets_root: Optional[Path], cfg: ChunkerCfg, out, base_doc: str) -> int:
+    lines = chunk_file(path, assets_root, cfg, base_doc)
+    for line in lines:
+        out.write(line + "\n")
+    return len(lines)
+
+
+def _chunk_task(task: Tuple[str, Optional[str], ChunkerCfg, str]) -> List[str]:
+    path, assets_root, cfg, base_doc = task
+    return chunk_file(Path(path), Path(assets_root) if assets_root else None, cfg, base_doc)
+
+
+def iter_chunked(tasks: Sequence[Tuple[Path, str]], assets_root: Optional[Path], cfg: ChunkerCfg, workers: int = 1) -> Iterable[List[str]]:
+    """Chunk lines per file, in the order of `tasks` whatever the number of workers."""
+    if workers <= 1 or len(tasks) <= 1:
+        for path, base_doc in tasks:
+            yield chunk_file(path, assets_root, cfg, base_doc)
+        return
+    payload = [(str(path), str(assets_root) if assets_root else None, cfg, base_doc) for path, base_doc in tasks]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        # map() keeps input order; small batches amortize the IPC per file
+        yield from pool.map(_chunk_task, payload, chunksize=max(1, len(payload) // (workers * 4)))
 
 
 def main():
@@ -177,6 +209,7 @@ def main():
     ap.add_argument("--assets", default=str(Path("output/assets")), help="Root of exported assets (images)")
     ap.add_argument("--max-chars", type=int, default=2500)
     ap.add_argument("--overlap", type=int, default=400)
+    ap.add_argument("--workers", type=int, default=1, help="Parallel chunking processes (0 = one per CPU); output is identical to a serial run")
     args = ap.parse_args()
 
     src = Path(args.src).resolve()
@@ -202,15 +235,22 @@ def main():
             files.append(p)
     files.sort()
 
+    tasks = [(f, f.parent.name if f.parent != src else f.stem) for f in files]
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    workers = min(workers, max(1, len(tasks)))
+
+    t0 = time.perf_counter()
     total_files = 0
     total_chunks = 0
     with out_path.open("w", encoding="utf-8") as fout:
-        for f in files:
-            base_doc = f.parent.name if f.parent != src else f.stem
-            process_file(f, assets_root, cfg, fout, base_doc=base_doc)
+        for lines in iter_chunked(tasks, assets_root, cfg, workers=workers):
+            for line in lines:
+                fout.write(line + "\n")
             total_files += 1
+            total_chunks += len(lines)
 
-    print(f"[DONE] Processed {total_files} files -> {out_path}")
+    elapsed = time.perf_counter() - t0
+    print(f"[DONE] Processed {total_files} files, {total_chunks} chunks in {elapsed:.1f}s ({workers} workers) -> {out_path}")
 
 
 if __name__ == "__main__":
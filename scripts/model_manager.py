@@ -0,0 +1,101 @@
+import gc
+import threading
+from typing import Callable, List, Optional
+
+import torch
+
+
+# generate() kwargs tied to the failed device; dropped for the CPU retry
+_DEVICE_BOUND_KWARGS = ("past_key_values", "assistant_model", "tokenizer", "assistant_tokenizer")
+
+
+def _to_device(inputs: dict, device) -> dict:
+    return {k: (v.to(device) if hasattr(v, "to") else v) for k, v in inputs.items()}
+
+
+class ModelManager:
+    """Owns the single live model instance shared by every request.
+    If generate() fails on an accelerator, the shared instance is swapped once to a CPU copy
+    (preloaded or loaded lazily through `cpu_loader`) and every later request is served from it.
+    The failed request is retried on CPU, except streamed ones, which re-raise after the swap.
+    """
+
+    def __init__(self, model, cpu_loader: Optional[Callable[[], object]] = None, preload_cpu: bool = False):
+        self._model = model
+        self._cpu_loader = cpu_loader
+        self._cpu_model = None
+        self._lock = threading.Lock()
+        self._on_downgrade: List[Callable[[object], None]] = []
+        self.downgrades = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        if preload_cpu and cpu_loader is not None and not self.on_cpu:
+            self._cpu_model = cpu_loader()
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def device(self):
+        return self._model.device
+
+    @property
+    def on_cpu(self) -> bool:
+        return torch.device(self._model.device).type == "cpu"
+
+    def on_downgrade(self, fn: Callable[[object], None]) -> None:
+        """Register a callback run with the new CPU model right after the swap (e.g. reset KV caches)."""
+        self._on_downgrade.append(fn)
+
+    def generate(self, inputs: dict, gen_kwargs: dict):
+        model = self._model
+        try:
+            with torch.inference_mode():
+                return model.generate(**inputs, **gen_kwargs)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            if torch.device(model.device).type == "cpu" or (self._cpu_loader is None and self._cpu_model is None):
+                raise
+            print(f"[model_manager] Error en {model.device}, se pasa a CPU: {e}")
+        # Fuera del except: la traza ya no retiene el modelo fallido y puede liberarse
+        failed_id = id(model)
+        del model
+        cpu_model = self._downgrade(failed_id)
+        if gen_kwargs.get("streamer") is not None:
+            # El streamer ya emitió parte de la respuesta y pasó el prompt; reintentar en él repetiría
+            # prompt y texto en la UI. Las siguientes peticiones ya se sirven en CPU.
+            raise RuntimeError(f"Generacion interrumpida ({self.last_error}); el modelo pasa a CPU, repite la pregunta")
+        # Reintento en CPU; la KV-cache reutilizada y el borrador viven en el dispositivo anterior
+        retry_kwargs = {k: v for k, v in gen_kwargs.items() if k not in _DEVICE_BOUND_KWARGS}
+        with torch.inference_mode():
+            return cpu_model.generate(**_to_device(inputs, cpu_model.device), **retry_kwargs)
+
+    def _downgrade(self, failed_id: int):
+        with self._lock:
+            if id(self._model) != failed_id:
+                # Otra petición ya hizo el cambio
+                return self._model
+            cpu_model = self._cpu_model if self._cpu_model is not None else self._cpu_loader()
+            self._model = cpu_model
+            self._cpu_model = None
+            self.downgrades += 1
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        for fn in self._on_downgrade:
+            try:
+                fn(cpu_model)
+            except Exception as e:
+                print(f"[model_manager] Callback tras el cambio a CPU fallido: {e}")
+        return cpu_model
+
+    def stats(self) -> dict:
+        return {
+            "device": str(self._model.device),
+            "downgrades": self.downgrades,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "cpu_preloaded": self._cpu_model is not None,
+        }
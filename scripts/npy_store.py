@@ -0,0 +1,310 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Layout inside the persist dir (next to / instead of the LlamaIndex JSON stores)
+VECTORS_FILE = "vectors.npy"
+NODES_FILE = "nodes.jsonl"
+MANIFEST_FILE = "manifest.json"
+# Lossy stores (int8 / PCA): query-side transform, and the originals kept for incremental rebuilds
+TRANSFORM_FILE = "transform.npz"
+FULL_VECTORS_FILE = "vectors_full.npy"
+STORE_FORMAT = "npy-v1"
+STORE_DTYPES = ("float32", "float16", "int8")
+
+
+def is_npy_store(persist_dir: Path) -> bool:
+    persist_dir = Path(persist_dir)
+    return (persist_dir / MANIFEST_FILE).exists() and (persist_dir / VECTORS_FILE).exists()
+
+
+def content_key(text: str, embed_model: str) -> str:
+    """Stable key of a chunk for incremental builds: same text + same model => same vector."""
+    h = hashlib.sha256()
+    h.update(embed_model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def store_fingerprint(ids: Sequence[str], keys: Sequence[str], tag: str = "") -> str:
+    """Short digest of the store contents; caches use it to detect an index rebuild.
+    `tag` describes lossy encodings (dtype / PCA), which change search results too.
+    """
+    h = hashlib.sha256()
+    h.update(tag.encode("ascii"))
+    for node_id, k in zip(ids, keys):
+        h.update(node_id.encode("utf-8"))
+        h.update(k.encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def normalize_rows(mat: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so that a dot product equals cosine similarity."""
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def fit_pca(mat: np.ndarray, dim: int, sample: int = 20_000, seed: int = 0) -> Tuple[np.ndarray, float]:
+    """Uncentered PCA basis (source_dim x dim): dot products of projected vectors approximate cosines.
+    Returns (components, explained energy ratio)."""
+    rng = np.random.default_rng(seed)
+    idx = np.sort(rng.choice(mat.shape[0], size=min(sample, mat.shape[0]), replace=False))
+    _, sv, vt = np.linalg.svd(np.asarray(mat[idx], dtype=np.float32), full_matrices=False)
+    dim = min(dim, vt.shape[0])
+    energy = float((sv[:dim] ** 2).sum() / max((sv**2).sum(), 1e-12))
+    return np.ascontiguousarray(vt[:dim].T.astype(np.float32)), energy
+
+
+def quantize_int8(mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension scalar quantization: mat ~= q * scale with q in [-127, 127]."""
+    scale = np.abs(mat).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(mat / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def write_store(
+    persist_dir: Path,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[dict],
+    vectors: np.ndarray,
+    embed_model: str,
+    dtype: str = "float32",
+    extra: Optional[dict] = None,
+    pca_dim: Optional[int] = None,
+    keys: Optional[Sequence[str]] = None,
+) -> dict:
+    """Persist embeddings as a contiguous .npy matrix plus a JSONL sidecar with id/text/metadata.
+    dtype int8 and/or pca_dim store a compressed matrix plus transform.npz (applied to queries by
+    NpyVectorStore); the originals go to vectors_full.npy (float16) for incremental rebuilds only.
+    Files are written to temporaries first and swapped in, so a crash never leaves a mixed store.
+    `keys` are the content keys of what was actually embedded (default: derived from `texts`).
+    """
+    persist_dir = Path(persist_dir)
+    persist_dir.mkdir(parents=True, exist_ok=True)
+    if not (len(ids) == len(texts) == len(metadatas) == len(vectors)):
+        raise ValueError("ids, texts, metadatas and vectors must have the same length")
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype} (choose from {', '.join(STORE_DTYPES)})")
+
+    full = normalize_rows(vectors) if len(vectors) else np.zeros((0, 0), dtype=np.float32)
+    if keys is None:
+        keys = [content_key(t, embed_model) for t in texts]
+    keys = list(keys)
+    source_dim = int(full.shape[1]) if full.ndim == 2 else 0
+    lossy = (dtype == "int8" or bool(pca_dim)) and len(full) > 0
+    transform: Dict[str, np.ndarray] = {}
+    info: dict = {}
+    mat = full
+    if lossy and pca_dim and pca_dim < source_dim:
+        components, energy = fit_pca(full, pca_dim)
+        mat = full @ components
+        transform["components"] = components
+        info["pca_dim"] = int(components.shape[1])
+        info["pca_energy"] = round(energy, 4)
+    if lossy and dtype == "int8":
+        mat, scale = quantize_int8(mat)
+        transform["scale"] = scale
+        # Never empty for a lossy store: readers key off the transform entry
+        info["dtype"] = "int8"
+    mat = np.ascontiguousarray(mat.astype(dtype))
+
+    vec_tmp = persist_dir / (VECTORS_FILE + ".tmp")
+    with vec_tmp.open("wb") as f:
+        np.save(f, mat)
+    tmps = [(vec_tmp, persist_dir / VECTORS_FILE)]
+    if lossy:
+        full_tmp = persist_dir / (FULL_VECTORS_FILE + ".tmp")
+        with full_tmp.open("wb") as f:
+            np.save(f, np.ascontiguousarray(full.astype(np.float16)))
+        tr_tmp = persist_dir / (TRANSFORM_FILE + ".tmp.npz")
+        np.savez(tr_tmp, **transform)
+        tmps += [(full_tmp, persist_dir / FULL_VECTORS_FILE), (tr_tmp, persist_dir / TRANSFORM_FILE)]
+
+    nodes_tmp = persist_dir / (NODES_FILE + ".tmp")
+    with nodes_tmp.open("w", encoding="utf-8") as f:
+        for node_id, text, meta in zip(ids, texts, metadatas):
+            f.write(json.dumps({"id": node_id, "text": text, "metadata": meta}, ensure_ascii=False) + "\n")
+
+    manifest = {
+        "format": STORE_FORMAT,
+        "embed_model": embed_model,
+        "count": int(mat.shape[0]),
+        "dim": int(mat.shape[1]) if mat.ndim == 2 else 0,
+        "dtype": dtype,
+        "normalized": True,
+        "source_dim": source_dim,
+        "transform": info if lossy else None,
+        # Row-aligned content keys: the next incremental build diffs against these
+        "fingerprint": store_fingerprint(ids, keys, tag="" if dtype == "float32" and not lossy else f"{dtype}|{info}"),
+        "keys": keys,
+    }
+    if extra:
+        manifest.update(extra)
+    man_tmp = persist_dir / (MANIFEST_FILE + ".tmp")
+    man_tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    for tmp, final in tmps:
+        tmp.replace(final)
+    nodes_tmp.replace(persist_dir / NODES_FILE)
+    man_tmp.replace(persist_dir / MANIFEST_FILE)
+    if not lossy:
+        # Leftovers of a previous compressed build
+        (persist_dir / TRANSFORM_FILE).unlink(missing_ok=True)
+        (persist_dir / FULL_VECTORS_FILE).unlink(missing_ok=True)
+    return manifest
+
+
+def read_manifest(persist_dir: Path) -> dict:
+    return json.loads((Path(persist_dir) / MANIFEST_FILE).read_text(encoding="utf-8"))
+
+
+def update_manifest(persist_dir: Path, **fields) -> dict:
+    """Add fields to an existing manifest (atomic replace)."""
+    persist_dir = Path(persist_dir)
+    manifest = read_manifest(persist_dir)
+    manifest.update(fields)
+    tmp = persist_dir / (MANIFEST_FILE + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(persist_dir / MANIFEST_FILE)
+    return manifest
+
+
+def load_reusable_vectors(persist_dir: Path, embed_model: str) -> Dict[str, np.ndarray]:
+    """Map content key -> stored vector from a previous build (empty if none or model changed)."""
+    persist_dir = Path(persist_dir)
+    if not is_npy_store(persist_dir):
+        return {}
+    manifest = read_manifest(persist_dir)
+    keys = manifest.get("keys")
+    if manifest.get("format") != STORE_FORMAT or manifest.get("embed_model") != embed_model or not keys:
+        return {}
+    # Compressed stores keep the original vectors aside; reuse those, not the lossy matrix
+    name = FULL_VECTORS_FILE if manifest.get("transform") is not None else VECTORS_FILE
+    vectors = np.load(persist_dir / name, mmap_mode="r")
+    if len(keys) != vectors.shape[0]:
+        return {}
+    return {k: np.asarray(vectors[i], dtype=np.float32) for i, k in enumerate(keys)}
+
+
+class NpyVectorStore:
+    """Flat exact-search store over a memory-mapped, row-normalized embedding matrix.
+    Compressed stores carry their transform: queries are projected with the PCA basis and int8 rows
+    are scored against the query scaled per dimension, in blocks (no full float copy of the matrix).
+    If an ANN index is attached (`ann`, e.g. ann_index.IVFIndex), search() only scans its candidates.
+    """
+
+    BLOCK_ROWS = 16384
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        nodes: List[dict],
+        manifest: dict,
+        components: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+    ):
+        self.vectors = vectors
+        self.nodes = nodes
+        self.manifest = manifest
+        self.components = components
+        self.scale = scale
+        self.ann = None
+        self.nprobe: Optional[int] = None
+        self._row_by_id = {n["id"]: i for i, n in enumerate(nodes)}
+
+    @classmethod
+    def load(cls, persist_dir: Path, mmap: bool = True) -> "NpyVectorStore":
+        persist_dir = Path(persist_dir)
+        manifest = read_manifest(persist_dir)
+        if manifest.get("format") != STORE_FORMAT:
+            raise ValueError(f"Unsupported store format in {persist_dir}: {manifest.get('format')}")
+        vectors = np.load(persist_dir / VECTORS_FILE, mmap_mode="r" if mmap else None)
+        nodes: List[dict] = []
+        with (persist_dir / NODES_FILE).open("r", encoding="utf-8") as f:
+            for line in f:
+                nodes.append(json.loads(line))
+        if len(nodes) != vectors.shape[0]:
+            raise ValueError(f"Corrupt store in {persist_dir}: {len(nodes)} nodes vs {vectors.shape[0]} vectors")
+        components = scale = None
+        # `is not None`: int8-only stores written before info["dtype"] existed have "transform": {}
+        if manifest.get("transform") is not None:
+            with np.load(persist_dir / TRANSFORM_FILE) as tr:
+                components = tr["components"] if "components" in tr.files else None
+                scale = tr["scale"] if "scale" in tr.files else None
+        return cls(vectors, nodes, manifest, components=components, scale=scale)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    def row_of(self, node_id: str) -> Optional[int]:
+        return self._row_by_id.get(node_id)
+
+    def prepare_query(self, query: Sequence[float]) -> np.ndarray:
+        """Normalize the query and map it to the stored space (PCA projection if any)."""
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        expected = self.components.shape[0] if self.components is not None else self.dim
+        if q.shape[0] != expected:
+            raise ValueError(
+                f"Query dim {q.shape[0]} does not match index dim {expected} "
+                f"(index built with {self.manifest.get('embed_model')})"
+            )
+        norm = float(np.linalg.norm(q))
+        q = q / norm if norm > 0 else q
+        return q @ self.components if self.components is not None else q
+
+    def _encoded_query(self, q: np.ndarray) -> np.ndarray:
+        # int8 rows hold x / scale, so x . q == rows . (q * scale)
+        return q * self.scale if self.scale is not None else q
+
+    def decode(self, rows=slice(None)) -> np.ndarray:
+        """Rows in the stored float space (dequantized), as float32."""
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        return block * self.scale if self.scale is not None else block
+
+    def score_rows(self, rows: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Similarity of a prepared query against the given rows."""
+        return np.asarray(self.vectors[rows], dtype=np.float32) @ self._encoded_query(q)
+
+    def scores(self, query: Sequence[float]) -> np.ndarray:
+        """Cosine similarity of the query against every row."""
+        q = self.prepare_query(query)
+        if self.vectors.dtype == np.float32:
+            return np.dot(self.vectors, q)
+        qe = self._encoded_query(q)
+        out = np.empty(len(self.nodes), dtype=np.float32)
+        for s in range(0, len(self.nodes), self.BLOCK_ROWS):
+            out[s : s + self.BLOCK_ROWS] = np.asarray(self.vectors[s : s + self.BLOCK_ROWS], dtype=np.float32) @ qe
+        return out
+
+    def search(self, query: Sequence[float], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the top_k most similar rows, best first."""
+        n = len(self.nodes)
+        if n == 0 or top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.ann is not None:
+            return self.ann.search(self, self.prepare_query(query), top_k, nprobe=self.nprobe)
+        return top_k_rows(self.scores(query), top_k)
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    k = min(top_k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    if k < scores.shape[0]:
+        rows = np.argpartition(-scores, k - 1)[:k]
+    else:
+        rows = np.arange(scores.shape[0])
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    return rows, scores[rows]
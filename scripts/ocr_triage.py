@@ -0,0 +1,136 @@
+import argparse
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Umbrales por defecto: una página de manual con capa de texto tiene cientos de caracteres
+MIN_CHARS = 80
+MAX_IMAGE_COVERAGE = 0.6
+MAX_BAD_RATIO = 0.25
+
+
+@dataclass
+class PageDecision:
+    page: int  # 1-based, como en Docling
+    chars: int  # caracteres no blancos extraíbles
+    image_coverage: float  # fracción del área de la página cubierta por imágenes
+    bad_ratio: float  # fracción de caracteres ilegibles (U+FFFD, controles)
+    ocr: bool
+    reason: str
+
+
+def _image_coverage(page, pdfium_c, width: float, height: float) -> float:
+    area = 0.0
+    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,), max_depth=2):
+        left, bottom, right, top = obj.get_pos()
+        # Recortar a la página; los solapes se suman (cota superior)
+        w = max(0.0, min(right, width) - max(left, 0.0))
+        h = max(0.0, min(top, height) - max(bottom, 0.0))
+        area += w * h
+    return min(1.0, area / max(width * height, 1e-9))
+
+
+def decide(chars: int, image_coverage: float, bad_ratio: float, min_chars: int = MIN_CHARS,
+           max_image_coverage: float = MAX_IMAGE_COVERAGE, max_bad_ratio: float = MAX_BAD_RATIO) -> Tuple[bool, str]:
+    """(necesita OCR, motivo) a partir de las medidas de una página."""
+    if chars < min_chars:
+        if image_coverage > 0.0:
+            return True, "sin capa de texto (escaneada)"
+        return False, "en blanco"
+    if bad_ratio > max_bad_ratio:
+        return True, "capa de texto ilegible"
+    if image_coverage >= max_image_coverage and chars < 4 * min_chars:
+        # Figuras o inserciones escaneadas que pueden contener texto no extraíble
+        return True, "imágenes grandes con poco texto"
+    return False, "capa de texto"
+
+
+def triage_pdf(pdf: Path, min_chars: int = MIN_CHARS, max_image_coverage: float = MAX_IMAGE_COVERAGE,
+               max_bad_ratio: float = MAX_BAD_RATIO) -> List[PageDecision]:
+    """Pre-pasada barata (pypdfium2, ya instalado con Docling): densidad de texto extraíble
+    y cobertura de imágenes de cada página para decidir dónde hace falta OCR."""
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+
+    decisions: List[PageDecision] = []
+    doc = pdfium.PdfDocument(str(pdf))
+    try:
+        for i in range(len(doc)):
+            page = doc[i]
+            try:
+                width, height = page.get_size()
+                textpage = page.get_textpage()
+                try:
+                    text = "".join(textpage.get_text_range().split())
+                finally:
+                    textpage.close()
+                bad = sum(1 for ch in text if ch == "\ufffd" or ord(ch) < 32)
+                chars = len(text)
+                bad_ratio = bad / chars if chars else 0.0
+                coverage = _image_coverage(page, pdfium_c, width, height)
+            finally:
+                page.close()
+            ocr, reason = decide(chars, coverage, bad_ratio, min_chars, max_image_coverage, max_bad_ratio)
+            decisions.append(PageDecision(i + 1, chars, round(coverage, 3), round(bad_ratio, 3), ocr, reason))
+    finally:
+        doc.close()
+    return decisions
+
+
+def ocr_runs(decisions: Sequence[PageDecision]) -> List[Tuple[int, int, bool]]:
+    """Rangos consecutivos (inicio, fin, ocr) con la misma decisión, en orden de página."""
+    runs: List[Tuple[int, int, bool]] = []
+    for d in decisions:
+        if runs and runs[-1][2] == d.ocr and runs[-1][1] == d.page - 1:
+            runs[-1] = (runs[-1][0], d.page, d.ocr)
+        else:
+            runs.append((d.page, d.page, d.ocr))
+    return runs
+
+
+def summary(decisions: Iterable[PageDecision]) -> dict:
+    decisions = list(decisions)
+    ocr_pages = [d.page for d in decisions if d.ocr]
+    return {"pages": len(decisions), "ocr_pages": len(ocr_pages), "ocr_page_list": ocr_pages}
+
+
+def write_report(decisions: Sequence[PageDecision], path: Path, pdf: Optional[Path] = None, thresholds: Optional[dict] = None) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "pdf": str(pdf) if pdf else None,
+        "thresholds": thresholds or {"min_chars": MIN_CHARS, "max_image_coverage": MAX_IMAGE_COVERAGE, "max_bad_ratio": MAX_BAD_RATIO},
+        **summary(decisions),
+        "decisions": [asdict(d) for d in decisions],
+    }
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def report_path(out_path: Path, pdf: Path) -> Path:
+    """Informe junto a la salida: <carpeta de salida>/<pdf>.ocr_pages.json."""
+    folder = out_path if out_path.is_dir() else out_path.parent
+    return folder / f"{pdf.stem}.ocr_pages.json"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Decidir por página si un PDF necesita OCR (texto extraíble e imágenes)")
+    parser.add_argument("pdfs", nargs="+", help="PDFs a analizar")
+    parser.add_argument("--min-chars", type=int, default=MIN_CHARS, help="Caracteres mínimos para considerar que hay capa de texto")
+    parser.add_argument("--max-image-coverage", type=float, default=MAX_IMAGE_COVERAGE, help="Cobertura de imágenes a partir de la cual se hace OCR")
+    parser.add_argument("--report-dir", default=None, help="Carpeta donde escribir <pdf>.ocr_pages.json")
+    args = parser.parse_args()
+
+    for name in args.pdfs:
+        pdf = Path(name).expanduser().resolve()
+        decisions = triage_pdf(pdf, args.min_chars, args.max_image_coverage)
+        s = summary(decisions)
+        print(f"{pdf.name}: OCR en {s['ocr_pages']}/{s['pages']} páginas {s['ocr_page_list'][:20]}{' ...' if s['ocr_pages'] > 20 else ''}")
+        if args.report_dir:
+            thresholds = {"min_chars": args.min_chars, "max_image_coverage": args.max_image_coverage, "max_bad_ratio": MAX_BAD_RATIO}
+            path = write_report(decisions, Path(args.report_dir).expanduser().resolve() / f"{pdf.stem}.ocr_pages.json", pdf, thresholds)
+            print(f"  Informe: {path}")
+
+
+if __name__ == "__main__":
+    main()
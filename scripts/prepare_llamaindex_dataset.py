@@ -3,7 +3,7 @@ import json
 import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Iterable, Iterator, List, Tuple, Union
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_INPUT = PROJECT_ROOT / "output" / "md_out" / "orca_manual_6_1_0_full.md"
@@ -22,11 +22,16 @@ class Chunk:
 HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
 
 
-def iter_blocks(md_text: str) -> Iterable[Tuple[str, int]]:
+def iter_blocks(md: Union[str, Iterable[str]]) -> Iterable[Tuple[str, int]]:
     """Yield paragraph blocks with their start offset in the full text.
     Splits by blank lines while preserving headings and code fences as separate blocks.
+    Accepts the whole text or any iterable of lines (e.g. an open file) so input can be streamed.
     """
-    lines = md_text.splitlines(keepends=True)
+    if isinstance(md, str):
+        lines: Iterable[str] = md.splitlines(keepends=True)
+    else:
+        # Re-split file lines so separators other than '\n' (\f, \u2028...) match str.splitlines
+        lines = (part for raw in md for part in raw.splitlines(keepends=True))
     block: List[str] = []
     offset = 0
     block_start = 0
@@ -38,9 +43,7 @@ def iter_blocks(md_text: str) -> Iterable[Tuple[str, int]]:
             yield ("".join(block), block_start)
             block = []
 
-    i = 0
-    while i < len(lines):
-        line = lines[i]
+    for line in lines:
         # Track code fences
         if line.strip().startswith("```"):
             if not in_code:
@@ -54,19 +57,16 @@ def iter_blocks(md_text: str) -> Iterable[Tuple[str, int]]:
                 block.append(line)
                 yield from flush()
             offset += len(line)
-            i += 1
             continue
 
         if in_code:
             block.append(line)
             offset += len(line)
-            i += 1
             continue
 
         if line.strip() == "":
             # blank line -> block boundary
             offset += len(line)
-            i += 1
             yield from flush()
             block_start = offset
             continue
@@ -77,7 +77,6 @@ def iter_blocks(md_text: str) -> Iterable[Tuple[str, int]]:
             block_start = offset
             block = [line]
             offset += len(line)
-            i += 1
             yield from flush()
             block_start = offset
             continue
@@ -87,18 +86,18 @@ def iter_blocks(md_text: str) -> Iterable[Tuple[str, int]]:
             block_start = offset
         block.append(line)
         offset += len(line)
-        i += 1
 
     # final flush
     if block:
         yield ("".join(block), block_start)
 
 
-def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Chunk]:
+def iter_chunks(md: Union[str, Iterable[str]], target_chars: int, overlap_chars: int) -> Iterator[Chunk]:
     """Greedy chunking: try to end on block boundaries, prefer to keep headings with following text.
     Tracks current heading stack to populate section_path metadata.
+    Chunks are yielded as soon as they are complete; only the heading stack and the
+    chunk under construction are kept in memory.
     """
-    chunks: List[Chunk] = []
     current: List[str] = []
     current_len = 0
     current_offset = 0
@@ -108,7 +107,7 @@ def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Ch
     def section_path() -> List[str]:
         return [t for _, t in section_stack]
 
-    for block, start_off in iter_blocks(md_text):
+    for block, start_off in iter_blocks(md):
         m = HEADING_RE.match(block.strip())
         if m:
             level = len(m.group(1))
@@ -119,7 +118,7 @@ def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Ch
             section_stack.append((level, title))
             # Headings as separators: if current chunk large, emit
             if current_len >= target_chars * 0.8:
-                chunks.append(
+                yield (
                     Chunk(
                         id=f"orca_{chunk_idx:05d}",
                         text="".join(current).strip(),
@@ -146,7 +145,7 @@ def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Ch
             current_offset = start_off
         # If adding this block exceeds target, emit current chunk and start a new one with overlap
         if current_len + len(block) > target_chars and current:
-            chunks.append(
+            yield (
                 Chunk(
                     id=f"orca_{chunk_idx:05d}",
                     text="".join(current).strip(),
@@ -167,7 +166,7 @@ def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Ch
             current_len += len(block)
 
     if current:
-        chunks.append(
+        yield (
             Chunk(
                 id=f"orca_{chunk_idx:05d}",
                 text="".join(current).strip(),
@@ -177,11 +176,15 @@ def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Ch
             )
         )
 
-    return chunks
+
+def build_chunks(md_text: str, target_chars: int, overlap_chars: int) -> List[Chunk]:
+    return list(iter_chunks(md_text, target_chars, overlap_chars))
 
 
-def write_jsonl(chunks: List[Chunk], out_path: Path, doc_name: str) -> None:
+def write_jsonl(chunks: Iterable[Chunk], out_path: Path, doc_name: str) -> int:
+    """Write chunks as they arrive (works with the iter_chunks generator); returns the count."""
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
     with out_path.open("w", encoding="utf-8") as f:
         for c in chunks:
             rec = {
@@ -195,6 +198,8 @@ def write_jsonl(chunks: List[Chunk], out_path: Path, doc_name: str) -> None:
                 },
             }
             f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            n += 1
+    return n
 
 
 def main():
@@ -210,10 +215,11 @@ def main():
     if not in_path.exists():
         raise FileNotFoundError(f"Input not found: {in_path}")
 
-    md_text = in_path.read_text(encoding="utf-8")
-    chunks = build_chunks(md_text, target_chars=args.target_chars, overlap_chars=args.overlap)
-    write_jsonl(chunks, Path(args.out).expanduser().resolve(), args.doc_name)
-    print(f"Wrote {len(chunks)} chunks -> {args.out}")
+    # Stream the Markdown line by line: peak memory does not grow with the manual size
+    with in_path.open("r", encoding="utf-8") as f:
+        chunks = iter_chunks(f, target_chars=args.target_chars, overlap_chars=args.overlap)
+        n = write_jsonl(chunks, Path(args.out).expanduser().resolve(), args.doc_name)
+    print(f"Wrote {n} chunks -> {args.out}")
 
 
 if __name__ == "__main__":
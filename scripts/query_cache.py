@@ -0,0 +1,125 @@
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from npy_store import MANIFEST_FILE, is_npy_store, read_manifest
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _WS_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def index_fingerprint(persist_dir: Path) -> str:
+    """Identify the index contents: the NumPy manifest fingerprint, else size/mtime of the JSON stores."""
+    persist_dir = Path(persist_dir)
+    if is_npy_store(persist_dir):
+        manifest = read_manifest(persist_dir)
+        if manifest.get("fingerprint"):
+            return str(manifest["fingerprint"])
+        st = (persist_dir / MANIFEST_FILE).stat()
+        return f"{st.st_size}-{st.st_mtime_ns}"
+    h = hashlib.sha256()
+    for p in sorted(persist_dir.glob("*.json")):
+        st = p.stat()
+        h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class QueryCache:
+    """Bounded LRU of query embeddings and retrieved (node_id, score) lists.
+    Entries are keyed by (normalized query, embedding model); results additionally by top-k.
+    Optionally persisted as JSON and dropped when the index fingerprint changes.
+    """
+
+    def __init__(self, max_entries: int = 256, path: Optional[Path] = None, fingerprint: str = ""):
+        self.max_entries = max(1, max_entries)
+        self.path = Path(path) if path else None
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.vector_hits = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self._load()
+
+    @staticmethod
+    def make_key(query: str, embed_model: str) -> str:
+        return f"{embed_model}\x1f{normalize_query(query)}"
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"[query_cache] Ignorando cache ilegible {self.path}: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            print("[query_cache] Indice cambiado desde la ultima sesion: cache invalidada")
+            return
+        for key, entry in data.get("entries", [])[-self.max_entries :]:
+            self._entries[key] = entry
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = {"fingerprint": self.fingerprint, "entries": list(self._entries.items())}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def bind(self, fingerprint: str) -> None:
+        """Invalidate everything if the index changed under us."""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def get_results(self, key: str, top_k: int) -> Optional[List[Tuple[str, float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            results = entry.get("results", {}).get(str(top_k)) if entry else None
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [(node_id, float(score)) for node_id, score in results]
+
+    def get_vector(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.get("vector") is None:
+                return None
+            self._entries.move_to_end(key)
+            self.vector_hits += 1
+            return entry["vector"]
+
+    def put(self, key: str, vector: Optional[List[float]], top_k: int, results: List[Tuple[str, float]]) -> None:
+        with self._lock:
+            entry = self._entries.get(key) or {"vector": None, "results": {}}
+            if vector is not None:
+                entry["vector"] = [round(float(x), 6) for x in vector]
+            entry["results"][str(top_k)] = [[node_id, round(float(score), 6)] for node_id, score in results]
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "vector_hits": self.vector_hits,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -2,10 +2,17 @@ import argparse
 import re
 from pathlib import Path
 
-from llama_index.core import StorageContext, load_index_from_storage, Settings
+from llama_index.core import PromptTemplate, Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import QueryBundle
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.huggingface import HuggingFaceLLM
 
+from answer_cache import AnswerCache
+from query_cache import QueryCache, index_fingerprint
+from reranker import CrossEncoderReranker
+from retrievers import RerankingRetriever, load_retriever
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_PERSIST = PROJECT_ROOT / "data" / "llamaindex" / "storage"
 
@@ -20,6 +27,19 @@ def main():
     parser.add_argument("--max-new-tokens", type=int, default=512)
     parser.add_argument("--temperature", type=float, default=0.2)
     parser.add_argument("--interactive", action="store_true", help="Interactive mode (REPL) if no --query is provided")
+    parser.add_argument("--hybrid", action="store_true", help="Fuse BM25 (bm25.npz) with dense retrieval via reciprocal-rank fusion")
+    parser.add_argument("--dense-top-k", type=int, default=None, help="Dense candidates before fusion (defaults to --top-k)")
+    parser.add_argument("--ann", action="store_true", help="Use the approximate IVF index (ivf.npz) when present")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed per query (defaults to the value chosen at build time)")
+    parser.add_argument("--rerank-model", default=None, help="Local cross-encoder for reranking (e.g. cross-encoder/mmarco-mMiniLMv2-L12-H384-v1)")
+    parser.add_argument("--rerank-candidates", type=int, default=20, help="Candidates retrieved before reranking")
+    parser.add_argument("--rerank-top-n", type=int, default=None, help="Passages kept after reranking (defaults to --top-k)")
+    parser.add_argument("--rerank-budget-ms", type=float, default=None, help="Reranker latency budget per query (ms)")
+    parser.add_argument("--query-cache", type=int, default=256, help="LRU entries for the query/retrieval cache (0 disables)")
+    parser.add_argument("--query-cache-file", default=None, help="JSON file to persist the query cache between runs")
+    parser.add_argument("--answer-cache", default=str(PROJECT_ROOT / ".cache" / "answer_cache.sqlite"), help="SQLite file caching deterministic answers")
+    parser.add_argument("--answer-cache-mb", type=float, default=64.0, help="Answer cache size limit in MB (0 disables)")
+    parser.add_argument("--answer-cache-max-temp", type=float, default=0.0, help="Highest sampling temperature still cached (0 = greedy only, which is always cached)")
     args = parser.parse_args()
 
     persist_dir = Path(args.persist).expanduser().resolve()
@@ -35,6 +55,7 @@ def main():
     # LLM (Gemma) via HuggingFace
     llm = HuggingFaceLLM(
         model_name=args.llm_model,
+        max_new_tokens=args.max_new_tokens,
         generate_kwargs={
             "temperature": args.temperature,
             "do_sample": args.temperature > 0,
@@ -47,12 +68,30 @@ def main():
     Settings.embed_model = embed_model
     Settings.llm = llm
 
-    # Load storage and index (0.14 API)
-    storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
-    index = load_index_from_storage(storage_context)
-
-    # Build query engine
-    query_engine = index.as_query_engine(similarity_top_k=args.top_k, response_mode="compact")
+    # Load index: NumPy store if present, else legacy LlamaIndex storage (0.14 API)
+    query_cache = None
+    if args.query_cache > 0:
+        query_cache = QueryCache(
+            max_entries=args.query_cache,
+            path=Path(args.query_cache_file) if args.query_cache_file else None,
+            fingerprint=index_fingerprint(persist_dir),
+        )
+    retriever = load_retriever(
+        persist_dir,
+        embed_model,
+        # With a reranker, retrieve a wider candidate pool first
+        similarity_top_k=args.rerank_candidates if args.rerank_model else args.top_k,
+        query_cache=query_cache,
+        hybrid=args.hybrid,
+        dense_top_k=args.dense_top_k,
+        ann=args.ann,
+        nprobe=args.nprobe,
+    )
+    if args.rerank_model:
+        reranker = CrossEncoderReranker(args.rerank_model, cache_folder=str(PROJECT_ROOT / ".cache"))
+        retriever = RerankingRetriever(
+            retriever, reranker, top_n=args.rerank_top_n or args.top_k, budget_ms=args.rerank_budget_ms
+        )
 
     # Spanish system instruction to ensure Spanish answers
     system_prompt = (
@@ -61,18 +100,57 @@ def main():
         "Usa únicamente la información de los pasajes recuperados; si falta información, dilo explícitamente. "
         "Sé conciso y técnico cuando proceda."
     )
+    # The instruction only goes to synthesis: retrieval (dense, BM25, query cache) sees the bare question
+    qa_template = PromptTemplate(
+        f"[Instrucción del sistema]: {system_prompt}\n\n"
+        "Pasajes recuperados:\n---------------------\n{context_str}\n---------------------\n\n"
+        "[Pregunta]: {query_str}\nRespuesta: "
+    )
+
+    # Build query engine
+    query_engine = RetrieverQueryEngine.from_args(retriever, response_mode="compact", text_qa_template=qa_template)
+
+    answer_cache = None
+    gen_params = {
+        "max_new_tokens": args.max_new_tokens,
+        "temperature": args.temperature,
+        "do_sample": args.temperature > 0,
+        "response_mode": "compact",
+    }
+    if args.answer_cache_mb > 0:
+        answer_cache = AnswerCache(
+            Path(args.answer_cache),
+            model_id=args.llm_model,
+            fingerprint=index_fingerprint(persist_dir),
+            # Per model and index, like chat_app: other tools/indexes sharing the file keep their answers
+            namespace=f"{args.llm_model}|{persist_dir}",
+            max_mb=args.answer_cache_mb,
+            max_temperature=args.answer_cache_max_temp,
+        )
+        if not answer_cache.cacheable(gen_params):
+            print(f"[answer_cache] temperature {args.temperature} is sampled (cache limit {args.answer_cache_max_temp}): answers are not cached")
 
     def run_one(q: str):
-        resp = query_engine.query(f"[Instrucción del sistema]: {system_prompt}\n\n[Pregunta]: {q}")
-        # Extract text and tidy whitespace
-        text = getattr(resp, "response", str(resp))
-        text = text.strip()
-        text = re.sub(r"\n{3,}", "\n\n", text)
+        # Retrieve first so the answer cache can key on the retrieved nodes
+        query = QueryBundle(q)
+        source_nodes = query_engine.retrieve(query)
+        text = cache_key = None
+        if answer_cache is not None and answer_cache.cacheable(gen_params):
+            cache_key = answer_cache.make_key(query.query_str, None, [n.node.node_id for n in source_nodes], gen_params)
+            text = answer_cache.get(cache_key)
+        if text is None:
+            resp = query_engine.synthesize(query, source_nodes)
+            # Extract text and tidy whitespace
+            text = getattr(resp, "response", str(resp))
+            text = text.strip()
+            text = re.sub(r"\n{3,}", "\n\n", text)
+            if cache_key is not None:
+                answer_cache.put(cache_key, text)
         print("=== Respuesta ===")
         print(text)
         print()
         print("=== Pasajes (Top-{}): ===".format(args.top_k))
-        for i, node in enumerate(resp.source_nodes, 1):
+        for i, node in enumerate(source_nodes, 1):
             meta = node.metadata or {}
             title = meta.get("title", "")
             section = meta.get("section_path", meta.get("section", ""))
@@ -100,6 +178,12 @@ def main():
                 break
             run_one(q)
 
+    if query_cache is not None:
+        query_cache.save()
+        print(f"[query_cache] {query_cache.stats()}")
+    if answer_cache is not None:
+        print(f"[answer_cache] {answer_cache.stats()}")
+
 
 if __name__ == "__main__":
     main()
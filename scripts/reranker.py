@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from query_cache import normalize_query
+
+
+class CrossEncoderReranker:
+    """Small CPU cross-encoder scoring (query, passage) pairs in one batched forward pass.
+    Scores are cached per (query, node_id); with a latency budget only as many uncached
+    candidates as fit (by measured ms/pair) are scored, the rest keep first-stage order.
+    """
+
+    def __init__(self, model_id: str, max_length: int = 384, cache_size: int = 4096, cache_folder: Optional[str] = None):
+        src = str(Path(model_id)) if Path(model_id).is_dir() else model_id
+        self.model_id = model_id
+        self.tokenizer = AutoTokenizer.from_pretrained(src, cache_dir=cache_folder)
+        self.model = AutoModelForSequenceClassification.from_pretrained(src, cache_dir=cache_folder)
+        self.model.eval()
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.ms_per_pair: Optional[float] = None
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _forward(self, query: str, passages: Sequence[str]) -> List[float]:
+        enc = self.tokenizer(
+            [query] * len(passages),
+            list(passages),
+            padding=True,
+            truncation="only_second",
+            max_length=self.max_length,
+            return_tensors="pt",
+        )
+        with torch.inference_mode():
+            logits = self.model(**enc).logits
+        if logits.shape[-1] == 1:
+            return logits[:, 0].float().tolist()
+        # Two-class heads: probability of the 'relevant' label
+        return torch.softmax(logits.float(), dim=-1)[:, -1].tolist()
+
+    def score(
+        self,
+        query: str,
+        candidates: Sequence[Tuple[str, str]],
+        budget_ms: Optional[float] = None,
+    ) -> List[Optional[float]]:
+        """Scores for (node_id, text) candidates, None for those skipped by the budget."""
+        qkey = normalize_query(query)
+        scores: List[Optional[float]] = [None] * len(candidates)
+        todo: List[int] = []
+        with self._lock:
+            for i, (node_id, _) in enumerate(candidates):
+                hit = self._cache.get((qkey, node_id))
+                if hit is None:
+                    todo.append(i)
+                else:
+                    self._cache.move_to_end((qkey, node_id))
+                    scores[i] = hit
+        if budget_ms is not None and self.ms_per_pair:
+            todo = todo[: max(1, int(budget_ms / self.ms_per_pair))]
+        if not todo:
+            return scores
+
+        t0 = time.perf_counter()
+        fresh = self._forward(query, [candidates[i][1] for i in todo])
+        per_pair = (time.perf_counter() - t0) * 1000.0 / len(todo)
+        with self._lock:
+            self.ms_per_pair = per_pair if self.ms_per_pair is None else 0.7 * self.ms_per_pair + 0.3 * per_pair
+            for i, s in zip(todo, fresh):
+                scores[i] = s
+                self._cache[(qkey, candidates[i][0])] = s
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
@@ -0,0 +1,201 @@
+from pathlib import Path
+from typing import List, Optional
+
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from ann_index import IVFIndex
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from npy_store import NpyVectorStore, is_npy_store
+from query_cache import QueryCache
+
+
+class NpyRetriever(BaseRetriever):
+    """LlamaIndex retriever backed by NpyVectorStore (vectorized top-k, no JSON parse at startup)."""
+
+    def __init__(self, store: NpyVectorStore, embed_model, similarity_top_k: int = 8):
+        self._store = store
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+        super().__init__()
+
+    @property
+    def store(self) -> NpyVectorStore:
+        return self._store
+
+    @property
+    def similarity_top_k(self) -> int:
+        return self._similarity_top_k
+
+    def node_for_row(self, row: int) -> TextNode:
+        rec = self._store.nodes[row]
+        return TextNode(id_=rec["id"], text=rec["text"], metadata=rec.get("metadata") or {})
+
+    def node_for_id(self, node_id: str) -> Optional[TextNode]:
+        row = self._store.row_of(node_id)
+        return self.node_for_row(row) if row is not None else None
+
+    def embed_query(self, query_bundle: QueryBundle) -> List[float]:
+        if query_bundle.embedding is not None:
+            return query_bundle.embedding
+        return self._embed_model.get_query_embedding(query_bundle.query_str)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rows, scores = self._store.search(self.embed_query(query_bundle), self._similarity_top_k)
+        return [NodeWithScore(node=self.node_for_row(int(r)), score=float(s)) for r, s in zip(rows, scores)]
+
+
+class HybridRetriever(NpyRetriever):
+    """Dense top-k from the NumPy store fused with BM25 top-k via reciprocal-rank fusion."""
+
+    def __init__(
+        self,
+        store: NpyVectorStore,
+        bm25: BM25Index,
+        embed_model,
+        similarity_top_k: int = 8,
+        dense_top_k: Optional[int] = None,
+        sparse_top_k: Optional[int] = None,
+        rrf_k: int = 60,
+    ):
+        if bm25.n_docs != len(store):
+            raise ValueError(f"BM25 index ({bm25.n_docs} docs) does not match vector store ({len(store)} rows)")
+        self._bm25 = bm25
+        self._dense_top_k = dense_top_k or similarity_top_k
+        self._sparse_top_k = sparse_top_k or similarity_top_k
+        self._rrf_k = rrf_k
+        super().__init__(store, embed_model, similarity_top_k=similarity_top_k)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense_rows, _ = self._store.search(self.embed_query(query_bundle), self._dense_top_k)
+        sparse_rows, _ = self._bm25.search(query_bundle.query_str, self._sparse_top_k)
+        fused = reciprocal_rank_fusion([dense_rows, sparse_rows], k=self._rrf_k)[: self._similarity_top_k]
+        return [NodeWithScore(node=self.node_for_row(row), score=score) for row, score in fused]
+
+
+class CachedRetriever(BaseRetriever):
+    """Serve repeated queries from a QueryCache; misses reuse a cached query vector when available."""
+
+    def __init__(self, base: NpyRetriever, cache: QueryCache, embed_model_id: str):
+        self._base = base
+        self._cache = cache
+        self._embed_model_id = embed_model_id
+        super().__init__()
+
+    @property
+    def cache(self) -> QueryCache:
+        return self._cache
+
+    @property
+    def base(self) -> NpyRetriever:
+        return self._base
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        key = QueryCache.make_key(query_bundle.query_str, self._embed_model_id)
+        top_k = self._base.similarity_top_k
+        cached = self._cache.get_results(key, top_k)
+        if cached is not None:
+            nodes = [(self._base.node_for_id(node_id), score) for node_id, score in cached]
+            if all(n is not None for n, _ in nodes):
+                return [NodeWithScore(node=n, score=score) for n, score in nodes]
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._cache.get_vector(key) or self._base.embed_query(query_bundle)
+        results = self._base.retrieve(query_bundle)
+        self._cache.put(key, query_bundle.embedding, top_k, [(r.node.node_id, r.score or 0.0) for r in results])
+        return results
+
+
+class RerankingRetriever(BaseRetriever):
+    """Retrieve a wide candidate pool with `base`, rescore it with a cross-encoder, keep the best top_n."""
+
+    def __init__(self, base: BaseRetriever, reranker, top_n: int = 4, budget_ms: Optional[float] = None):
+        self._base = base
+        self._reranker = reranker
+        self._top_n = top_n
+        self._budget_ms = budget_ms
+        super().__init__()
+
+    @property
+    def base(self) -> BaseRetriever:
+        return self._base
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        candidates = self._base.retrieve(query_bundle)
+        if not candidates:
+            return []
+        scores = self._reranker.score(
+            query_bundle.query_str,
+            [(c.node.node_id, c.node.get_content()) for c in candidates],
+            budget_ms=self._budget_ms,
+        )
+        # Scored candidates first (by cross-encoder score); unscored ones keep first-stage order
+        ranked = sorted(
+            range(len(candidates)),
+            key=lambda i: (scores[i] is None, -(scores[i] or 0.0), i),
+        )
+        return [
+            NodeWithScore(node=candidates[i].node, score=scores[i] if scores[i] is not None else candidates[i].score)
+            for i in ranked[: self._top_n]
+        ]
+
+
+def load_retriever(
+    persist_dir: Path,
+    embed_model,
+    similarity_top_k: int = 8,
+    query_cache: Optional[QueryCache] = None,
+    hybrid: bool = False,
+    dense_top_k: Optional[int] = None,
+    ann: bool = False,
+    nprobe: Optional[int] = None,
+) -> BaseRetriever:
+    """Open the persisted index: the NumPy store if present, else the legacy LlamaIndex JSON storage.
+    With hybrid=True and a bm25.npz next to the store, dense hits are fused with BM25 hits (RRF).
+    With ann=True and an up-to-date ivf.npz, dense search scans only the `nprobe` closest IVF lists.
+    """
+    persist_dir = Path(persist_dir)
+    if is_npy_store(persist_dir):
+        store = NpyVectorStore.load(persist_dir)
+        print(f"[npy_store] {len(store)} vectors (dim={store.dim}, dtype={store.vectors.dtype}) mmap desde {persist_dir}")
+        if ann:
+            if not IVFIndex.exists(persist_dir):
+                print("[ann] No hay ivf.npz en el indice; busqueda exacta")
+            else:
+                ivf = IVFIndex.load(persist_dir)
+                if ivf.fingerprint != store.manifest.get("fingerprint"):
+                    print("[ann] ivf.npz no corresponde al indice actual (reconstruir con --ann ivf); busqueda exacta")
+                else:
+                    store.ann, store.nprobe = ivf, nprobe or ivf.nprobe
+                    print(f"[ann] IVF nlist={ivf.nlist}, nprobe={store.nprobe}")
+        bm25 = None
+        if hybrid:
+            if not BM25Index.exists(persist_dir):
+                print("[bm25] No hay bm25.npz en el indice; recuperacion solo densa")
+            else:
+                bm25 = BM25Index.load(persist_dir)
+                if bm25.fingerprint != store.manifest.get("fingerprint"):
+                    print("[bm25] bm25.npz no corresponde al indice actual (reconstruir sin --no-bm25); recuperacion solo densa")
+                    bm25 = None
+        if bm25 is not None:
+            print(f"[bm25] {len(bm25.terms)} terminos, {len(bm25.doc_ids)} postings")
+            retriever = HybridRetriever(
+                store, bm25, embed_model, similarity_top_k=similarity_top_k, dense_top_k=dense_top_k
+            )
+        else:
+            retriever = NpyRetriever(store, embed_model, similarity_top_k=dense_top_k or similarity_top_k)
+        if query_cache is not None:
+            query_cache.bind(store.manifest.get("fingerprint", ""))
+            # Fused results depend on the retrieval mode, so it is part of the cache key
+            cache_id = store.manifest.get("embed_model", "")
+            if store.ann is not None:
+                cache_id += f"|ivf:{store.nprobe}"
+            if isinstance(retriever, HybridRetriever):
+                cache_id += f"|bm25-rrf:{retriever._dense_top_k}"
+            return CachedRetriever(retriever, query_cache, cache_id)
+        return retriever
+    if query_cache is not None:
+        print("[query_cache] Solo disponible con --store npy; indice JSON sin cache")
+    storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
+    index = load_index_from_storage(storage_context, embed_model=embed_model)
+    return index.as_retriever(similarity_top_k=similarity_top_k)
@@ -28,6 +28,40 @@ def build_args():
     # Offline toggle if present
     if os.getenv("HF_OFFLINE", "0") in ("1", "true", "True"):
         args.append("--offline")
+    # Hybrid BM25 + dense retrieval
+    if os.getenv("CHAT_HYBRID", "0") in ("1", "true", "True"):
+        args.append("--hybrid")
+    # Approximate IVF search (ivf.npz)
+    if os.getenv("CHAT_ANN", "0") in ("1", "true", "True"):
+        args.append("--ann")
+    # Reuse the KV-cache of the fixed system prompt / per-session history
+    if os.getenv("CHAT_KV_CACHE", "0") in ("1", "true", "True"):
+        args.append("--kv-cache")
+    # Token-by-token streaming in the UI
+    if os.getenv("CHAT_STREAM", "0") in ("1", "true", "True"):
+        args.append("--stream")
+    # Bind the port first, load models/index in the background
+    if os.getenv("CHAT_FAST_START", "0") in ("1", "true", "True"):
+        args.append("--fast-start")
+    # Small draft model for assisted/speculative generation
+    draft_model = os.getenv("CHAT_DRAFT_MODEL")
+    if draft_model:
+        args.extend(["--draft-model", draft_model])
+    # Disk answer cache size in MB (0 disables)
+    answer_cache_mb = os.getenv("CHAT_ANSWER_CACHE_MB")
+    if answer_cache_mb:
+        args.extend(["--answer-cache-mb", answer_cache_mb])
+    # Prompt token budget (0 = legacy fixed 600-char passage cut)
+    context_tokens = os.getenv("CHAT_CONTEXT_TOKENS")
+    if context_tokens:
+        args.extend(["--context-tokens", context_tokens])
+    # Per-request latency traces (JSONL) and a local Prometheus endpoint
+    telemetry_log = os.getenv("CHAT_TELEMETRY_LOG")
+    if telemetry_log:
+        args.extend(["--telemetry-log", telemetry_log])
+    metrics_port = os.getenv("CHAT_METRICS_PORT")
+    if metrics_port:
+        args.extend(["--metrics-port", metrics_port])
     # Local models dir for cache/offline
     models_dir = os.getenv("MODELS_DIR")
     if models_dir:
@@ -0,0 +1,108 @@
+import threading
+
+import torch
+
+
+class StepCounter:
+    """Streamer hook counting target forward passes: generate() calls put() once with the prompt
+    and then once per step with every token accepted in that step. Forwards to an optional inner streamer."""
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.steps = 0
+        self.tokens = 0
+        self._seen_prompt = False
+
+    def put(self, value) -> None:
+        if self._seen_prompt:
+            self.steps += 1
+            self.tokens += int(value.numel()) if hasattr(value, "numel") else 1
+        self._seen_prompt = True
+        if self.inner is not None:
+            self.inner.put(value)
+
+    def end(self) -> None:
+        # Ready for the next generate() call
+        self._seen_prompt = False
+        if self.inner is not None:
+            self.inner.end()
+
+
+class DraftModel:
+    """Small assistant model for assisted (speculative) generation with transformers.
+    The draft proposes tokens and the target verifies them in one forward pass, so greedy outputs
+    are identical to the target alone. Different vocabularies use universal assisted decoding
+    (greedy only); sampled requests then run without the draft.
+    """
+
+    def __init__(self, model, tokenizer, target_tokenizer, num_tokens: int = 0, cpu_loader=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.target_tokenizer = target_tokenizer
+        self.same_vocab = tokenizer.get_vocab() == target_tokenizer.get_vocab()
+        self.num_tokens = num_tokens
+        self._cpu_loader = cpu_loader
+        self._lock = threading.Lock()
+        self.enabled = True
+        self.requests = 0
+        self.steps = 0
+        self.tokens = 0
+        self._configure()
+
+    def _configure(self) -> None:
+        if self.num_tokens > 0:
+            # Fixed draft length so the acceptance estimate is meaningful
+            self.model.generation_config.num_assistant_tokens = self.num_tokens
+            self.model.generation_config.num_assistant_tokens_schedule = "constant"
+
+    def gen_kwargs(self, gen_kwargs: dict) -> dict:
+        """Draft kwargs for this request ({} when the draft cannot be used)."""
+        if not self.enabled:
+            return {}
+        if not self.same_vocab and gen_kwargs.get("do_sample"):
+            return {}
+        if self.same_vocab:
+            return {"assistant_model": self.model}
+        return {"assistant_model": self.model, "tokenizer": self.target_tokenizer, "assistant_tokenizer": self.tokenizer}
+
+    def check(self, target_model, prompt_ids) -> None:
+        """Short greedy run with the draft; disables it if this target/transformers combination rejects it."""
+        inputs = {"input_ids": prompt_ids.to(target_model.device)}
+        kwargs = {"max_new_tokens": 4, "do_sample": False, "pad_token_id": self.target_tokenizer.eos_token_id}
+        try:
+            with torch.inference_mode():
+                target_model.generate(**inputs, **kwargs, **self.gen_kwargs(kwargs))
+        except Exception as e:
+            self.enabled = False
+            print(f"[draft] Desactivado (el modelo no admite generacion asistida): {e}")
+
+    def to_cpu(self, _target=None) -> None:
+        """ModelManager downgrade callback: the draft must live on the same device as the target."""
+        if torch.device(self.model.device).type == "cpu":
+            return
+        if self._cpu_loader is None:
+            self.enabled = False
+            return
+        self.model = self._cpu_loader()
+        self._configure()
+
+    def record(self, counter: StepCounter) -> None:
+        with self._lock:
+            self.requests += 1
+            self.steps += counter.steps
+            self.tokens += counter.tokens
+
+    def stats(self) -> dict:
+        per_step = self.tokens / self.steps if self.steps else 0.0
+        out = {
+            "enabled": self.enabled,
+            "same_vocab": self.same_vocab,
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "target_steps": self.steps,
+            "tokens_per_step": round(per_step, 3),
+        }
+        if self.num_tokens > 0 and self.steps:
+            # Each step accepts k drafted tokens plus one from the target: k / num_tokens
+            out["acceptance"] = round(max(0.0, per_step - 1.0) / self.num_tokens, 3)
+        return out
@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence
+
+
+class Deferred:
+    """Stand-in for an object still loading in the background; resolves on first attribute access."""
+
+    def __init__(self, future: Future):
+        self._future = future
+
+    def __getattr__(self, name: str):
+        return getattr(self._future.result(), name)
+
+
+class Startup:
+    """Runs the heavy loaders (LLM, embedder, index...) concurrently in background threads.
+    Every phase is timed and logged; `status()` gives a readiness line for the UI while loading.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self._futures: Dict[str, Future] = {}
+        self._started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _log(self, name: str, seconds: float, failed: bool = False) -> None:
+        total = time.perf_counter() - self.t0
+        state = "FALLO" if failed else "listo"
+        print(f"[startup] {name}: {state} en {seconds:.2f} s (t={total:.2f} s)")
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a synchronous phase (imports, UI build...)."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - t
+            self._log(name, self.timings[name])
+
+    def start(self, name: str, fn: Callable[..., object], deps: Sequence[str] = ()) -> Future:
+        """Run fn(*dep_results) in a daemon thread once its dependencies have finished."""
+        future: Future = Future()
+        with self._lock:
+            self._futures[name] = future
+            dep_futures = [self._futures[d] for d in deps]
+
+        def _run():
+            try:
+                args = [f.result() for f in dep_futures]
+            except Exception as e:
+                future.set_exception(e)
+                return
+            t = time.perf_counter()
+            with self._lock:
+                self._started[name] = t
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.timings[name] = time.perf_counter() - t
+                self._log(name, self.timings[name], failed=True)
+                print(f"[startup] {name}: {type(e).__name__}: {e}")
+                future.set_exception(e)
+                return
+            self.timings[name] = time.perf_counter() - t
+            self._log(name, self.timings[name])
+            future.set_result(result)
+
+        threading.Thread(target=_run, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    def future(self, name: str) -> Future:
+        return self._futures[name]
+
+    def result(self, name: str, timeout: Optional[float] = None):
+        return self._futures[name].result(timeout=timeout)
+
+    def ready(self) -> bool:
+        return all(f.done() and f.exception() is None for f in self._futures.values())
+
+    def failed(self) -> Dict[str, BaseException]:
+        return {n: f.exception() for n, f in self._futures.items() if f.done() and f.exception() is not None}
+
+    def wait(self) -> None:
+        """Block until every loader finished; re-raise the first failure."""
+        for f in list(self._futures.values()):
+            f.result()
+        print(f"[startup] Todo cargado en {time.perf_counter() - self.t0:.2f} s")
+
+    def status(self) -> str:
+        now = time.perf_counter()
+        parts = []
+        for name, f in self._futures.items():
+            if not f.done():
+                started = self._started.get(name)
+                parts.append(f"{name}: cargando ({now - started:.0f} s)" if started else f"{name}: en espera")
+            elif f.exception() is not None:
+                parts.append(f"{name}: error ({f.exception()})")
+            else:
+                parts.append(f"{name}: listo ({self.timings.get(name, 0.0):.1f} s)")
+        return " | ".join(parts)
@@ -0,0 +1,223 @@
+import json
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Seconds; shared by every stage histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RequestTrace:
+    """Spans (stage -> seconds) and attributes of one chat request."""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.attrs: Dict[str, object] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - t)
+
+    def add_span(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def to_dict(self, total: float) -> dict:
+        return {
+            "ts": round(self.start, 3),
+            "request_id": self.request_id,
+            "session_id": self.session_id,
+            "total_ms": round(total * 1000.0, 2),
+            "spans_ms": {k: round(v * 1000.0, 2) for k, v in self.spans.items()},
+            **self.attrs,
+        }
+
+
+class _NullTrace:
+    """Trace that records nothing, so instrumented code needs no `if trace` checks."""
+
+    def span(self, name: str):
+        return nullcontext()
+
+    def add_span(self, name: str, seconds: float) -> None:
+        pass
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class TokenTimer:
+    """Streamer-compatible hook for model.generate: the first put() is the prompt, the second the
+    first new token, so prefill = first token - start and decode = end - first token."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self._puts = 0
+
+    def put(self, value) -> None:
+        self._puts += 1
+        if self._puts == 2 and self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def end(self) -> None:
+        self.end_time = time.perf_counter()
+
+    def record(self, trace) -> None:
+        end = self.end_time or time.perf_counter()
+        if self.first_token is None:
+            trace.add_span("generate", end - self.start)
+            return
+        trace.add_span("prefill", self.first_token - self.start)
+        trace.add_span("decode", end - self.first_token)
+
+
+@contextmanager
+def request_trace(telemetry: Optional["Telemetry"], session_id: Optional[str] = None):
+    """Trace one request and record it on exit (errors included); NULL_TRACE without telemetry."""
+    if telemetry is None:
+        yield NULL_TRACE
+        return
+    trace = telemetry.start(session_id)
+    error = None
+    try:
+        yield trace
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        telemetry.finish(trace, error)
+
+
+class Telemetry:
+    """Per-request traces appended to a JSONL log, plus stage histograms and token counters
+    exposed in Prometheus text format by an optional local /metrics endpoint."""
+
+    def __init__(self, log_path: Optional[Path] = None):
+        self.log_path = Path(log_path) if log_path else None
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._total = Histogram()
+        self._counters: Dict[str, float] = {"requests": 0, "errors": 0, "tokens_in": 0, "tokens_out": 0}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        if self.log_path:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def start(self, session_id: Optional[str] = None) -> RequestTrace:
+        return RequestTrace(session_id)
+
+    def add_gauge(self, name: str, fn: Callable[[], float]) -> None:
+        """Value read at scrape time (e.g. model downgrades, cache hit rate)."""
+        self._gauges[name] = fn
+
+    def finish(self, trace: RequestTrace, error: Optional[BaseException] = None) -> dict:
+        total = trace.elapsed
+        if error is not None:
+            trace.set(error=f"{type(error).__name__}: {error}")
+        decode = trace.spans.get("decode")
+        tokens_out = trace.attrs.get("tokens_out")
+        if decode and tokens_out:
+            trace.set(tokens_per_s=round(float(tokens_out) / decode, 2))
+        record = trace.to_dict(total)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            for name, seconds in trace.spans.items():
+                self._stages.setdefault(name, Histogram()).observe(seconds)
+            self._total.observe(total)
+            self._counters["requests"] += 1
+            self._counters["errors"] += 1 if error is not None else 0
+            self._counters["tokens_in"] += int(trace.attrs.get("tokens_in") or 0)
+            self._counters["tokens_out"] += int(tokens_out or 0)
+            if self.log_path:
+                with self.log_path.open("a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        return record
+
+    def render_metrics(self) -> str:
+        lines = [
+            "# HELP chat_stage_seconds Duration of each stage of a chat request",
+            "# TYPE chat_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self._stages):
+                lines += self._stages[name].render("chat_stage_seconds", f'stage="{name}"')
+            lines += ["# TYPE chat_request_seconds histogram"]
+            lines += self._total.render("chat_request_seconds", 'path="chat"')
+            for name, value in self._counters.items():
+                lines += [f"# TYPE chat_{name}_total counter", f"chat_{name}_total {value:g}"]
+        for name, fn in self._gauges.items():
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            lines += [f"# TYPE chat_{name} gauge", f"chat_{name} {value:g}"]
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        telemetry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_metrics().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # silence per-scrape access logs
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
@@ -1,8 +1,15 @@
 import argparse
 import json
+import multiprocessing as mp
+import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
 
 ARTIFACT_LINE_PATTERNS = [
     re.compile(r"^\s*<!--\s*image\s*-->\s*$", re.I),
@@ -16,6 +23,21 @@ REPLACEMENTS = [
     (re.compile(r"\s{2,}"), " "),
 ]
 
+# --- Precompiled single-pass engine (same output as applying the lists above in order) ---
+# The ARTIFACT_LINE_PATTERNS as one alternation: one match() per line instead of one search() per pattern
+ARTIFACT_LINE_REGEX = re.compile(
+    r"\s*<!--\s*(?:image|formula-not-decoded)\s*-->\s*$|(?:continues on next page|continued from previous page)\b",
+    re.I,
+)
+# Both REPLACEMENTS in one scan: a whitespace/odd-symbol run becomes one space, except a lone plain
+# whitespace character (e.g. a single newline), which the sequential version leaves untouched.
+# The lookbehind keeps a single branch starting at each position (much faster than `...{2,}|[odd]`)
+_ODD = "\u2423\u21AA\u2192\u200B\u00A0"
+SPACE_REGEX = re.compile(rf"[\s{_ODD}](?:[\s{_ODD}]+|(?<=[{_ODD}]))")
+_END_REGEX = re.compile(r"\s+end\b", re.I)
+_BANG_REGEX = re.compile(r"^!(.+?)\s+")
+_BLANK_LINES_REGEX = re.compile(r"\n{3,}")
+
 # Heuristic ORCA splitter: introduce newlines before common markers
 ORCA_BREAK_REGEX = re.compile(
     r"\s+(%[A-Za-z][A-Za-z0-9_]*|end\b|\*\s+xyz\b|VeryTightSCF|TightSCF|RIJCOSX|PAL\d*\b|PAL\b|def2\-[A-Za-z0-9\-]+|def2/[A-Za-z0-9\-]+|NROOTS|nroots|DT0L|DTol)\b",
@@ -25,13 +47,13 @@ ORCA_BREAK_REGEX = re.compile(
 
 def looks_like_orca_flat(s: str) -> bool:
     s0 = s.strip()
-    if not s0:
+    # Cheapest test first: only long single-line texts qualify
+    if len(s0) <= 120 or "\n" in s0:
         return False
-    has_bang = s0.startswith("!")
-    has_pct = "%" in s0
-    has_geom = "* xyz" in s0.lower() or s0.lower().startswith("*xyz")
-    long_single_line = ("\n" not in s0) and (len(s0) > 120)
-    return (has_bang or has_pct or has_geom) and long_single_line
+    if s0.startswith("!") or "%" in s0:
+        return True
+    low = s0.lower()
+    return "* xyz" in low or low.startswith("*xyz")
 
 
 def reformat_orca_text(s: str) -> str:
@@ -40,64 +62,114 @@ def reformat_orca_text(s: str) -> str:
     s = ORCA_BREAK_REGEX.sub(lambda m: "\n" + m.group(1), s)
     # Geometry markers on their own lines
     s = s.replace(" * xyz", "\n* xyz")
-    s = re.sub(r"\s+end\b", "\nend", s, flags=re.I)
+    s = _END_REGEX.sub("\nend", s)
     # If starts with '!' and first segment is long, break after it
     if s.startswith("!") and "\n" not in s.split("\n", 1)[0]:
-        s = re.sub(r"^!(.+?)\s+", r"!\1\n", s, count=1)
+        s = _BANG_REGEX.sub(r"!\1\n", s, count=1)
     # Put closing '*' on its own line (best effort)
     s = s.replace(" * ", "\n* ")
     # Collapse multiple blank lines
-    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = _BLANK_LINES_REGEX.sub("\n\n", s)
     return s
 
 
 def clean_text(text: str) -> str:
-    # Remove artifact lines
-    lines = text.splitlines()
-    kept = [ln for ln in lines if not any(p.search(ln) for p in ARTIFACT_LINE_PATTERNS)]
-    s = "\n".join(kept)
+    # Remove artifact lines (splitlines also normalizes \r\n, \r... to \n)
+    s = "\n".join([ln for ln in text.splitlines() if not ARTIFACT_LINE_REGEX.match(ln)])
     # Replace odd characters and normalize spaces
-    for pat, repl in REPLACEMENTS:
-        s = pat.sub(repl, s)
+    s = SPACE_REGEX.sub(" ", s)
     # If we detect a flattened ORCA input, reformat it
     if looks_like_orca_flat(s):
         s = reformat_orca_text(s)
     return s.strip()
 
 
-def process_chunks(chunks_path: Path, backup: bool = True) -> None:
+def clean_lines(lines: List[str]) -> Tuple[List[str], int, int]:
+    """Clean a batch of JSONL lines: (output lines, records, modified). Unparseable lines are dropped
+    and unchanged records are written back verbatim (no json.dumps)."""
+    out: List[str] = []
+    total = 0
+    changed = 0
+    for line in lines:
+        total += 1
+        try:
+            rec = json.loads(line)
+        except Exception:
+            continue
+        text = rec.get("text", "")
+        cleaned = clean_text(text)
+        if cleaned != text:
+            changed += 1
+            rec["text"] = cleaned
+            out.append(json.dumps(rec, ensure_ascii=False) + "\n")
+        else:
+            out.append(line if line.endswith("\n") else line + "\n")
+    return out, total, changed
+
+
+def _batches(lines: Iterable[str], size: int) -> Iterable[List[str]]:
+    it = iter(lines)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _bounded_map(pool: ProcessPoolExecutor, batches: Iterable[List[str]], window: int) -> Iterator[Tuple[List[str], int, int]]:
+    """Like pool.map(clean_lines, batches) in input order, but with at most `window` batches in flight,
+    so the input is read as results are written instead of all up front."""
+    pending: deque = deque()
+    for batch in batches:
+        pending.append(pool.submit(clean_lines, batch))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def process_chunks(chunks_path: Path, backup: bool = True, workers: int = 1, batch_size: int = 2000) -> None:
     tmp_out = chunks_path.with_suffix(".jsonl.tmp")
     if backup:
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         chunks_path.rename(chunks_path.with_suffix(f".jsonl.bak_{ts}"))
     in_f = chunks_path.with_suffix(f".jsonl.bak_{ts}") if backup else chunks_path
 
+    t0 = time.perf_counter()
     total = 0
     changed = 0
     with in_f.open("r", encoding="utf-8") as fin, tmp_out.open("w", encoding="utf-8") as fout:
-        for line in fin:
-            total += 1
-            try:
-                rec = json.loads(line)
-            except Exception:
-                continue
-            text = rec.get("text", "")
-            cleaned = clean_text(text)
-            if cleaned != text:
-                changed += 1
-                rec["text"] = cleaned
-            fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        batches = _batches(fin, batch_size)
+        if workers <= 1:
+            results = map(clean_lines, batches)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+            # Results come back in batch order, so the output order matches the input
+            results = _bounded_map(pool, batches, 2 * workers)
+        try:
+            for out, n, n_changed in results:
+                fout.writelines(out)
+                total += n
+                changed += n_changed
+        finally:
+            if pool is not None:
+                pool.shutdown()
     tmp_out.replace(chunks_path)
-    print(f"Processed {total} chunks. Modified {changed}.")
+    elapsed = time.perf_counter() - t0
+    print(f"Processed {total} chunks. Modified {changed}. {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} records/s, {max(1, workers)} workers)")
 
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser(description="Tidy LlamaIndex chunks.jsonl in place")
     ap.add_argument("--chunks", default=str(Path("data/llamaindex/chunks.jsonl")), help="Path to chunks.jsonl")
     ap.add_argument("--no-backup", action="store_true", help="Do not create a .bak timestamped backup")
+    ap.add_argument("--workers", type=int, default=1, help="Cleaning processes (0 = one per CPU); output order is preserved")
+    ap.add_argument("--batch-size", type=int, default=2000, help="Records per batch sent to a worker")
     args = ap.parse_args()
 
     path = Path(args.chunks).resolve()
     if not path.exists():
         raise SystemExit(f"Not found: {path}")
-    process_chunks(path, backup=not args.no_backup)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    process_chunks(path, backup=not args.no_backup, workers=workers, batch_size=max(1, args.batch_size))
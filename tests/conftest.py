@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The scripts import each other as top-level modules (python scripts/xxx.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
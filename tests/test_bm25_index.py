@@ -0,0 +1,22 @@
+from bm25_index import BM25Index, tokenize
+
+
+def test_nested_parens_keep_balanced_token():
+    assert tokenize("(DLPNO-CCSD(T))")[0] == "dlpno-ccsd(t)"
+    assert tokenize("usa DLPNO-CCSD(T)).")[1] == "dlpno-ccsd(t)"
+    assert tokenize("CCSD(T)")[0] == "ccsd(t)"
+
+
+def test_compound_tokens_also_split():
+    toks = tokenize("def2-TZVP RIJCOSX")
+    assert toks[0] == "def2-tzvp"
+    assert {"def2", "tzvp", "rijcosx"} <= set(toks)
+
+
+def test_save_load_keeps_fingerprint(tmp_path):
+    BM25Index.build(["a b c", "DLPNO-CCSD(T) x"], fingerprint="abc123").save(tmp_path)
+    loaded = BM25Index.load(tmp_path)
+    assert loaded.fingerprint == "abc123"
+    assert loaded.search("dlpno-ccsd(t)", 2)[0].tolist() == [1]
+    BM25Index.remove(tmp_path)
+    assert not BM25Index.exists(tmp_path)
@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+
+from npy_store import MANIFEST_FILE, NpyVectorStore, load_reusable_vectors, write_store
+
+
+def _store(tmp_path, name, vectors, **kwargs):
+    n = len(vectors)
+    return write_store(
+        tmp_path / name,
+        ids=[f"n{i}" for i in range(n)],
+        texts=[f"text {i}" for i in range(n)],
+        metadatas=[{} for _ in range(n)],
+        vectors=vectors,
+        embed_model="test-model",
+        **kwargs,
+    )
+
+
+def test_int8_without_pca_matches_float32(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 32)).astype(np.float32)
+    manifest = _store(tmp_path, "int8", vectors, dtype="int8")
+    _store(tmp_path, "f32", vectors)
+    assert manifest["transform"]
+
+    exact = NpyVectorStore.load(tmp_path / "f32")
+    quant = NpyVectorStore.load(tmp_path / "int8")
+    assert quant.scale is not None
+    for q in rng.normal(size=(20, 32)).astype(np.float32):
+        rows_f, scores_f = exact.search(q, 1)
+        rows_q, scores_q = quant.search(q, 1)
+        assert rows_q[0] == rows_f[0]
+        assert abs(float(scores_q[0]) - float(scores_f[0])) < 0.02
+
+
+def test_int8_reuses_full_precision_vectors(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(10, 8)).astype(np.float32)
+    _store(tmp_path, "int8", vectors, dtype="int8")
+    reused = load_reusable_vectors(tmp_path / "int8", "test-model")
+    assert all(v.dtype == np.float32 and abs(float(np.linalg.norm(v)) - 1.0) < 1e-2 for v in reused.values())
+
+
+def test_legacy_empty_transform_still_loads_scale(tmp_path):
+    vectors = np.random.default_rng(2).normal(size=(10, 8)).astype(np.float32)
+    _store(tmp_path, "int8", vectors, dtype="int8")
+    path = tmp_path / "int8" / MANIFEST_FILE
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    manifest["transform"] = {}
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert NpyVectorStore.load(tmp_path / "int8").scale is not None